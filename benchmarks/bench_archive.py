@@ -0,0 +1,261 @@
+"""Benchmark the whole archive pipeline against fake channels, and catch regressions against saved baselines
+
+Usage: `python -m benchmarks.bench_archive [--scenario channel category server] [--save-baseline]`
+
+Each scenario builds a fake guild (see fake_discord) and archives it the way the archive commands would:
+`channel` runs ArchiveCog.archive_one_channel on one big channel, `category` and `server` run a whole job through
+ArchiveCog.run_job, several channels at a time. Every scenario reports messages/sec, archive bytes/sec, peak RSS,
+the most disk the working directory took up at once and how long the event loop was blocked for.
+
+Results are compared against benchmarks/baselines.json, and the run fails if throughput dropped or memory, disk or
+loop lag grew by more than --tolerance. Baselines depend on the machine, so save new ones with --save-baseline
+before comparing on a different one."""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+# config.py needs these to import, but nothing here talks to Discord
+os.environ.setdefault("DISCORD_GUILD_ID", "0")
+os.environ.setdefault("DISCORD_ANNOUNCEMENTS_CHANNEL", "0")
+
+from benchmarks.fake_discord import FakeBot, make_guild
+from benchmarks.loop_lag import LoopLagMonitor
+from modules.archive import archive_constants, archive_utils
+from modules.archive.archive_jobs import ArchiveJob, ArchiveProgress, PRIORITY_CATEGORY, PRIORITY_SERVER
+from modules.archive.cog import ArchiveCog
+from modules.archive.compression import POLICIES
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Scenario -> (channels in the guild, messages per channel)
+SCENARIOS = {
+    "channel": (1, 20_000),
+    "category": (4, 5_000),
+    "server": (8, 5_000),
+}
+
+# Metric -> whether bigger is better
+METRICS = {
+    "messages_per_sec": True,
+    "bytes_per_sec": True,
+    "peak_rss_mb": False,
+    "disk_high_water_mb": False,
+    "max_loop_lag_ms": False,
+}
+
+
+class ResourceSampler:
+    """Keeps track of this process's peak RSS and the most disk a directory takes up, from a thread of its own so
+    sampling doesn't hold up the event loop being measured"""
+
+    def __init__(self, directory, interval=0.05):
+        self.directory = directory
+        self.interval = interval
+        self.peak_rss = 0
+        self.disk_high_water = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # Peak for the whole process so far, in KB on Linux
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _disk(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    # Deleted while we were looking
+                    pass
+        return total
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, self._rss())
+        self.disk_high_water = max(self.disk_high_water, self._disk())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+async def archive_channel(cog, guild, destination, options):
+    """Archive one channel straight through archive_one_channel, sending its parts to the destination"""
+    channel = guild.text_channels[0]
+    progress = ArchiveProgress(1)
+    progress.start()
+    state = {'archive_name': channel.name, 'last_message_id': None, 'parts': 0, 'attachments': {},
+             'incremental': False}
+
+    async def send_part(part, number, final):
+        try:
+            file, embed, _ = await cog.get_file_and_embed(channel, guild.filesize_limit, part)
+            await destination.send(file=file, embed=embed)
+        finally:
+            part.remove_files()
+
+    job_dir = archive_utils.make_job_dir()
+    try:
+        await cog.archive_one_channel(channel, job_dir, guild.filesize_limit, POLICIES[options.compression], progress,
+                                      send_part, state, options.split, options.export, options.index,
+                                      options.transcode)
+    finally:
+        archive_utils.remove_job_dir(job_dir)
+    return progress
+
+
+async def archive_job(cog, guild, destination, options, priority):
+    """Run a whole category or server job, the way the queue would"""
+    if priority == PRIORITY_CATEGORY:
+        target = guild.categories[0]
+        channels = target.text_channels
+    else:
+        target = guild
+        channels = guild.text_channels
+    job = ArchiveJob(destination, guild, "benchmark", target, channels, options, priority, "")
+    job.id = 1
+    job.status = ArchiveJob.RUNNING
+    await cog.run_job(job)
+    return job.progress
+
+
+async def run_scenario(name, args):
+    channels, messages = SCENARIOS[name]
+    guild, destination = make_guild(channels, messages=args.messages or messages,
+                                    attachment_rate=args.attachment_rate, attachment_size=args.attachment_size,
+                                    duplicate_ratio=args.duplicate_ratio, latency=args.latency,
+                                    attachment_latency=args.attachment_latency, send_latency=args.send_latency)
+    cog = ArchiveCog(FakeBot(guild))
+    options = archive_utils.ArchiveOptions(compression=args.compression, export=args.export)
+    sampler = ResourceSampler(archive_constants.ARCHIVE)
+    monitor = LoopLagMonitor()
+    sampler.start()
+    monitor.start()
+    start = time.perf_counter()
+    try:
+        if name == "channel":
+            progress = await archive_channel(cog, guild, destination, options)
+        else:
+            progress = await archive_job(cog, guild, destination, options,
+                                         PRIORITY_CATEGORY if name == "category" else PRIORITY_SERVER)
+    finally:
+        elapsed = time.perf_counter() - start
+        await monitor.stop()
+        sampler.stop()
+    archived = progress.total_channels
+    expected = sum(len(channel.ids) for channel in guild.text_channels[:archived])
+    if progress.messages != expected:
+        raise RuntimeError(f"{name}: archived {progress.messages} of {expected} messages")
+    return {
+        "messages_per_sec": progress.messages / elapsed,
+        "bytes_per_sec": progress.bytes_written / elapsed,
+        "peak_rss_mb": sampler.peak_rss / 1_048_576,
+        "disk_high_water_mb": sampler.disk_high_water / 1_048_576,
+        "max_loop_lag_ms": monitor.max_lag * 1000,
+    }, {
+        "seconds": elapsed,
+        "messages": progress.messages,
+        "files_sent": destination.files_sent,
+        "mean_loop_lag_ms": monitor.mean_lag * 1000,
+    }
+
+
+def compare(name, results, baseline, tolerance):
+    """Names of the metrics that got worse than the baseline by more than tolerance"""
+    regressions = []
+    for metric, bigger_is_better in METRICS.items():
+        if metric not in baseline:
+            continue
+        if bigger_is_better:
+            worse = results[metric] < baseline[metric] * (1 - tolerance)
+        else:
+            # Lag is a few ms at best, so don't fail over noise
+            worse = results[metric] > max(baseline[metric] * (1 + tolerance), baseline[metric] + 1)
+        if worse:
+            regressions.append(f"{name}: {metric} {results[metric]:.1f} vs baseline {baseline[metric]:.1f}")
+    return regressions
+
+
+def load_baselines():
+    try:
+        with open(BASELINES_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def params(name, args):
+    """What a scenario's results depend on, so results are only compared against a baseline run the same way"""
+    channels, messages = SCENARIOS[name]
+    return {"channels": channels, "messages": args.messages or messages, "attachment_rate": args.attachment_rate,
+            "attachment_size": args.attachment_size, "duplicate_ratio": args.duplicate_ratio,
+            "latency": args.latency, "attachment_latency": args.attachment_latency,
+            "send_latency": args.send_latency, "compression": args.compression, "export": args.export}
+
+
+async def main(args):
+    baselines = load_baselines()
+    regressions = []
+    for name in args.scenario:
+        results, details = await run_scenario(name, args)
+        print(f"{name:<9} {results['messages_per_sec']:9.0f} msgs/sec "
+              f"{results['bytes_per_sec'] / 1_048_576:7.2f} MB/sec  "
+              f"peak RSS {results['peak_rss_mb']:6.1f}MB  disk {results['disk_high_water_mb']:6.1f}MB  "
+              f"loop lag {results['max_loop_lag_ms']:5.1f}ms max, {details['mean_loop_lag_ms']:.2f}ms mean  "
+              f"({details['messages']} messages in {details['seconds']:.2f}s, {details['files_sent']} files sent)")
+        baseline = baselines.get(name)
+        if args.save_baseline:
+            baselines[name] = {"params": params(name, args), **results}
+        elif baseline is None:
+            print(f"{name:<9} no baseline, save one with --save-baseline")
+        elif baseline["params"] != params(name, args):
+            print(f"{name:<9} baseline was run with different options, not comparing")
+        else:
+            regressions += compare(name, results, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baselines to {BASELINES_PATH}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--messages", type=int, help="messages per channel, instead of each scenario's own")
+    parser.add_argument("--attachment-rate", type=float, default=0.05, help="fraction of messages with an attachment")
+    parser.add_argument("--attachment-size", type=int, default=200_000, help="bytes per attachment")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="fraction of attachments that are reposts")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per history request")
+    parser.add_argument("--attachment-latency", type=float, default=0.05, help="seconds per attachment download")
+    parser.add_argument("--send-latency", type=float, default=0.2, help="seconds to send a message or file")
+    parser.add_argument("--compression", choices=list(POLICIES), default=archive_constants.DEFAULT_COMPRESSION)
+    parser.add_argument("--export", choices=["jsonl", "binary"])
+    parser.add_argument("--tolerance", type=float, default=0.25, help="how much worse than the baseline is allowed")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the new baselines")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,111 @@
+"""Benchmark the archive attachment download pool against a local fake CDN
+
+Usage: `python -m benchmarks.bench_attachment_pool [--attachments 200] [--size 200000] [--latency 0.05]`
+
+Starts an aiohttp server on localhost that serves random bytes after an artificial delay, then archives the same
+set of attachments at several concurrency levels and reports attachments/sec for each one."""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from modules.archive import archive_utils
+from modules.archive.archive_writer import ArchiveWriter
+from modules.archive.attachment_pool import AttachmentPool
+
+
+class FakeCDN:
+    """Serves `size` random bytes for any path after `latency` seconds, failing `fail_rate` of the requests"""
+
+    def __init__(self, size, latency, fail_rate):
+        self.size = size
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.payload = os.urandom(size)
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            return web.Response(status=503)
+        return web.Response(body=self.payload)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class FakeAttachment:
+    """Stands in for nextcord.Attachment, downloading from the fake CDN"""
+
+    def __init__(self, session, id, url, filename, size):
+        self.session = session
+        self.id = id
+        self.url = url
+        self.filename = filename
+        self.size = size
+
+    async def read(self):
+        async with self.session.get(self.url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+async def run(concurrency, attachments, cdn, session):
+    archive_utils.reset_archive_dir()
+    writer = ArchiveWriter(archive_utils.make_job_dir(), "bench")
+    pool = AttachmentPool(writer, concurrency=concurrency, backoff=0.01)
+    start = time.perf_counter()
+    try:
+        for i in range(attachments):
+            attachment = FakeAttachment(session, i, f"{cdn.url}/{i}/img.png", "img.png", cdn.size)
+            await pool.add_message(f"message {i}", [attachment])
+        await pool.finish()
+    finally:
+        # stop any downloads still going if the run failed
+        pool.cancel()
+        await writer.close()
+    elapsed = time.perf_counter() - start
+    return elapsed, pool.failed
+
+
+async def main(args):
+    cdn = FakeCDN(args.size, args.latency, args.fail_rate)
+    await cdn.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            print(f"{args.attachments} attachments of {args.size} bytes, {args.latency * 1000:.0f}ms latency")
+            for concurrency in args.concurrency:
+                elapsed, failed = await run(concurrency, args.attachments, cdn, session)
+                print(f"concurrency {concurrency:>3}: {args.attachments / elapsed:8.1f} attachments/sec "
+                      f"({elapsed:.2f}s, {failed} failed)")
+    finally:
+        await cdn.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--attachments", type=int, default=200)
+    parser.add_argument("--size", type=int, default=200_000, help="bytes per attachment")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per CDN request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of CDN requests that fail")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(args))
@@ -0,0 +1,75 @@
+"""Benchmark how much writing a large archive blocks the event loop
+
+Usage: `python -m benchmarks.bench_event_loop_lag [--attachments 40] [--size 4000000]`
+
+Archives the same compressible attachments twice: once compressing on the event loop (how the archiver used to
+work), and once through ArchiveWriter, which compresses on its own thread. While each run is going, a monitor
+measures how late the event loop wakes up, which is how long gateway heartbeats and other loops would be
+stalled for."""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from modules.archive import archive_utils
+from modules.archive.archive_writer import ArchiveWriter
+from benchmarks.loop_lag import LoopLagMonitor
+
+
+def make_attachment(size):
+    # Half random and half repeated bytes, so deflate has real work to do
+    words = [os.urandom(8) for _ in range(256)]
+    return b"".join(random.choice(words) for _ in range(size // 8))
+
+
+async def run_blocking(attachments):
+    """Compress on the event loop, like archive_one_channel used to"""
+    writer = ArchiveWriter(archive_utils.make_job_dir(), "blocking")
+    for i, data in enumerate(attachments):
+        writer._add_attachment(f"{i}.bin", data)
+        writer._write_text(f"message {i} {i}.bin\n")
+        # Give the monitor a chance to run between attachments, like awaiting the next download would
+        await asyncio.sleep(0)
+    writer._close()
+
+
+async def run_offloaded(attachments):
+    """Compress through ArchiveWriter's async API"""
+    writer = ArchiveWriter(archive_utils.make_job_dir(), "offloaded")
+    for i, data in enumerate(attachments):
+        await writer.add_attachment(f"{i}.bin", data)
+        await writer.write_line(f"message {i} {i}.bin")
+    await writer.close()
+
+
+async def measure(name, coro):
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+    print(f"{name:>10}: {elapsed:6.2f}s, max loop lag {monitor.max_lag * 1000:8.1f}ms, "
+          f"mean loop lag {monitor.mean_lag * 1000:6.1f}ms")
+    return monitor.max_lag
+
+
+async def main(args):
+    attachments = [make_attachment(args.size) for _ in range(args.attachments)]
+    print(f"{args.attachments} attachments of {args.size} bytes")
+    archive_utils.reset_archive_dir()
+    before = await measure("blocking", run_blocking(attachments))
+    after = await measure("offloaded", run_offloaded(attachments))
+    print(f"max loop lag reduced {before / after if after else float('inf'):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--attachments", type=int, default=40)
+    parser.add_argument("--size", type=int, default=4_000_000, help="bytes per attachment")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(args))
@@ -0,0 +1,92 @@
+"""Benchmark reading a big channel's history page by page against the time-sliced HistoryFetcher
+
+Usage: `python -m benchmarks.bench_history_fetch [--messages 20000] [--latency 0.05]`
+
+Builds a fake channel whose history requests take `latency` seconds each, like a round trip to Discord, then reads
+it once with channel.history() (one page after another) and once with HistoryFetcher at several concurrency levels.
+Reports messages/sec and the number of requests, and checks every run hands out the same messages in the same
+order."""
+import argparse
+import asyncio
+import bisect
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import nextcord
+
+from modules.archive.history_fetcher import HistoryFetcher, PAGE_SIZE
+
+
+class FakeMessage:
+    def __init__(self, id):
+        self.id = id
+        self.created_at = nextcord.utils.snowflake_time(id)
+
+
+class FakeHistoryChannel:
+    """Stands in for a nextcord.TextChannel with `messages` messages sent over the last `days` days.
+    Half of the messages are bunched up in the first tenth of that time, like a channel that was busy during a
+    hunt and quiet after it"""
+
+    def __init__(self, messages, days, latency):
+        self.latency = latency
+        self.requests = 0
+        now = datetime.now(timezone.utc)
+        start = now - timedelta(days=days)
+        busy = timedelta(days=days / 10)
+        times = ([start + busy * random.random() for _ in range(messages // 2)]
+                 + [start + (now - start) * random.random() for _ in range(messages - messages // 2)])
+        # Unique, sorted snowflakes
+        self.ids = sorted({nextcord.utils.time_snowflake(t) + i for i, t in enumerate(times)})
+        self.id = nextcord.utils.time_snowflake(start) - 1
+        self.last_message_id = self.ids[-1]
+
+    async def history(self, limit=100, after=None, before=None, oldest_first=None):
+        """Like TextChannel.history, waiting `latency` seconds for every page of 100"""
+        low = bisect.bisect_right(self.ids, after.id) if after else 0
+        high = bisect.bisect_left(self.ids, before.id) if before else len(self.ids)
+        if limit is not None:
+            high = min(high, low + limit)
+        for page_start in range(low, high, PAGE_SIZE):
+            self.requests += 1
+            await asyncio.sleep(self.latency)
+            for id in self.ids[page_start:min(page_start + PAGE_SIZE, high)]:
+                yield FakeMessage(id)
+
+
+async def run_serial(channel):
+    return [msg.id async for msg in channel.history(limit=None, oldest_first=True)]
+
+
+async def run_sliced(channel, concurrency, budget, slices):
+    fetcher = HistoryFetcher(channel, asyncio.Semaphore(budget), slices=slices, concurrency=concurrency)
+    return [msg.id async for msg in fetcher.messages()]
+
+
+async def main(args):
+    channel = FakeHistoryChannel(args.messages, args.days, args.latency)
+    print(f"{len(channel.ids)} messages over {args.days} days, {args.latency * 1000:.0f}ms per request")
+    runs = [("channel.history()", lambda: run_serial(channel))]
+    runs += [(f"sliced, concurrency {concurrency:>2}", lambda c=concurrency: run_sliced(channel, c, args.budget, args.slices))
+             for concurrency in args.concurrency]
+    for name, run in runs:
+        channel.requests = 0
+        start = time.perf_counter()
+        ids = await run()
+        elapsed = time.perf_counter() - start
+        status = "ok" if ids == channel.ids else "WRONG ORDER OR MISSING MESSAGES"
+        print(f"{name:<24} {len(ids) / elapsed:9.0f} messages/sec ({elapsed:.2f}s, {channel.requests} requests) "
+              f"{status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--days", type=float, default=365)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per history request")
+    parser.add_argument("--slices", type=int, default=128, help="most slices to cut the history into")
+    parser.add_argument("--budget", type=int, default=16, help="history requests in flight at the same time")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    asyncio.run(main(args))
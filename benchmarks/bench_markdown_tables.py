@@ -0,0 +1,60 @@
+"""Benchmark rendering the markdown tables in results posts
+
+Usage: `python -m benchmarks.bench_markdown_tables [--tables 1 5 10 20] [--runs 200]`
+
+Builds results posts the size of real r/Arithmancy ones (a paragraph and a points table per level) with more and more
+levels, then times format_tables on each, with and without table2ascii's rendering, and checks every table made it
+into the output."""
+import argparse
+import time
+
+from modules.reddit_feed import markdown_tables
+from modules.reddit_feed.markdown_tables import format_tables
+
+HOUSES = ("Gryffindor", "Hufflepuff", "Ravenclaw", "Slytherin")
+
+
+def results_post(tables):
+	"""a results post with `tables` levels"""
+	sections = ["Thanks to everyone who played this week! Here's how the houses did.\r\n"]
+	for level in range(1, tables + 1):
+		sections.append(f"**Level {level} Results**\r\n\r\nCongratulations to everyone who solved level {level}, "
+						f"the answer was **ANSWER{level}**.\r\n")
+		rows = [f"**Level**|{'|'.join(f'**{house}**' for house in HOUSES)}|", ":-:|:-:|:-:|:-:|:-:|"]
+		for puzzle in range(1, 6):
+			rows.append(f"Puzzle {puzzle}|" + "".join(f"{(level * puzzle * (i + 3)) % 97}|" for i in range(4)))
+		rows.append("**Arithmancy Points**|" + "".join(f"**{level * 40 + i}**|" for i in range(4)))
+		rows.append("House Points|" + "".join(f"{level * 4 + i}|" for i in range(4)))
+		sections.append("\r\n".join(rows) + "\r\n")
+	sections.append("See you next week for another round of puzzles!")
+	return "\r\n".join(sections).replace("\r\n", "\n")
+
+
+def time_per_post(text, runs):
+	start = time.perf_counter()
+	for _ in range(runs):
+		output = format_tables(text)
+	return (time.perf_counter() - start) / runs, output
+
+
+def main(args):
+	render_table = markdown_tables.render_table
+	for tables in args.tables:
+		text = results_post(tables)
+		seconds, output = time_per_post(text, args.runs)
+		# just the parsing, with every table rendered as a placeholder
+		markdown_tables.render_table = lambda rows: "TABLE"
+		try:
+			parse_seconds, _ = time_per_post(text, args.runs)
+		finally:
+			markdown_tables.render_table = render_table
+		status = "ok" if output.count("```ml") == tables else "MISSING TABLES"
+		print(f"{tables:>3} tables, {len(text):>6} chars: {seconds * 1e6:9.1f}us per post "
+			  f"({parse_seconds * 1e6:7.1f}us parsing, {seconds / tables * 1e6:7.1f}us per table) {status}")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--tables", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+	parser.add_argument("--runs", type=int, default=200)
+	main(parser.parse_args())
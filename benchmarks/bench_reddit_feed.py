@@ -0,0 +1,152 @@
+"""Replay a hunt's Reddit posts through the feed, checking each one is announced once and measuring how quickly
+
+Usage: `python -m benchmarks.bench_reddit_feed [--gap 0.5] [--interval 0.25] [--max-latency 3]`
+
+Runs RedditFeedCog against fake_reddit's FakeReddit and announcements channel, with the real seen store, formatters,
+outbox and edit watcher. Recorded announcement, puzzle and results posts go up one every `gap` seconds, after a few
+older posts that were up before the feed first started, with nothing in its seen store. Then a results post is edited. There are more
+posts than fit in one publish window, so the last ones have to wait for it.
+
+Reports the time from each post going up to its announcement being sent and published, how long each kind of post
+takes to format, and how many Reddit requests the feed made per post. The run fails (exit code 1) if a post wasn't
+announced exactly once and in order, an older post was announced, the edit didn't reach its announcement, or an
+announcement took longer than --max-latency."""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# config.py and the cog need these to import, but nothing here talks to Discord or Reddit
+for name, value in (("DISCORD_GUILD_ID", "0"), ("DISCORD_ANNOUNCEMENTS_CHANNEL", "1"),
+					("REDDIT_CLIENT_ID", "benchmark"), ("REDDIT_CLIENT_SECRET", "benchmark"),
+					("REDDIT_USERNAME", "benchmark"), ("REDDIT_PASSWORD", "benchmark")):
+	os.environ.setdefault(name, value)
+
+import config
+from benchmarks.fake_reddit import FakeAnnouncementsChannel, FakeBot, FakeReddit, FakeSubmission, recorded_posts
+from modules.reddit_feed import cog as feed
+from modules.reddit_feed.reddit_post import RedditPost
+
+
+def format_times(bot, runs):
+	"""seconds it takes to format each kind of post, without any caching"""
+	times = {}
+	for kind, title, selftext in recorded_posts():
+		post = RedditPost(bot, FakeSubmission("format", title, selftext))
+		start = time.perf_counter()
+		for _ in range(runs):
+			post.render()
+		times.setdefault(kind, []).append((time.perf_counter() - start) / runs)
+	return times
+
+
+def summary(values):
+	return f"{sum(values) / len(values) * 1000:7.1f}ms mean {max(values) * 1000:7.1f}ms max"
+
+
+async def replay(args):
+	reddit = FakeReddit(args.reddit_latency)
+	# the cog made a real asyncpraw client when it was imported
+	await feed.reddit.close()
+	feed.reddit = reddit
+	channel = FakeAnnouncementsChannel(config.REDDIT_FEEDS.get("arithmancy", config.ANNOUNCEMENTS_CHANNEL_ID),
+									   args.discord_latency)
+	bot = FakeBot(channel)
+	# posts from before the feed started with an empty seen store, which it shouldn't announce
+	old_posts = [reddit.post(f"Old puzzle {number}", "Already announced") for number in range(3)]
+
+	cog = feed.RedditFeedCog(bot)
+	cog.scheduler.fast = cog.scheduler.slow = args.interval
+	cog.outbox.send_interval = args.send_interval
+	cog.outbox.publish_window = args.publish_window
+	await cog.on_ready()
+	posts = []
+	try:
+		for kind, title, selftext in recorded_posts():
+			await asyncio.sleep(args.gap)
+			posts.append((kind, reddit.post(title, selftext)))
+		deadline = time.perf_counter() + args.timeout
+		while len(channel.published) < len(posts) and time.perf_counter() < deadline:
+			await asyncio.sleep(0.05)
+		feed_calls, polls = reddit.api_calls, cog.scheduler.polls
+		# fix a results post, and check the edit watcher picks it up with one request
+		edited = posts[-1][1]
+		edited.edit("**Corrected:** " + edited.selftext)
+		info_calls = reddit.calls["info"]
+		await cog.watch_edits()
+		edit_calls = reddit.calls["info"] - info_calls
+	finally:
+		cog.reddit_feed.cancel()
+		cog.watch_edits.cancel()
+		await cog.outbox.stop()
+
+	failures = []
+	sent_at = dict(channel.sent)
+	published_at = dict(channel.published)
+	latencies = {}
+	publish_latencies = []
+	message_ids = []
+	for kind, post in posts:
+		announced = cog.announcements.get_message(post.id)
+		if announced is None:
+			failures.append(f"{post.title} wasn't announced")
+			continue
+		message_id = announced[1]
+		message_ids.append(message_id)
+		latency = sent_at[message_id] - reddit.posted_at[post.id]
+		latencies.setdefault(kind, []).append(latency)
+		if latency > args.max_latency:
+			failures.append(f"{post.title} took {latency:.2f}s to be announced")
+		if message_id in published_at:
+			publish_latencies.append(published_at[message_id] - reddit.posted_at[post.id])
+		else:
+			failures.append(f"{post.title} wasn't published")
+		description = channel.messages[message_id].embed.description
+		if kind == "results" and ("╔" not in description or ":-:" in description):
+			failures.append(f"{post.title}'s tables weren't rendered")
+	if len(channel.sent) != len(posts):
+		failures.append(f"{len(channel.sent)} announcements sent for {len(posts)} posts")
+	if message_ids != sorted(message_ids):
+		failures.append("posts were announced out of order")
+	for post in old_posts:
+		if cog.announcements.get_message(post.id) is not None:
+			failures.append(f"{post.title} was announced again")
+	edited_message = cog.announcements.get_message(edited.id)
+	if edited_message is None or [id for id, _ in channel.edits] != [edited_message[1]]:
+		failures.append("the edited post's announcement wasn't updated")
+	if edit_calls != 1:
+		failures.append(f"checking for edits took {edit_calls} requests")
+
+	print(f"{len(posts)} posts, one every {args.gap}s, polling every {args.interval}s")
+	for kind, values in latencies.items():
+		print(f"{kind:<14} post to announcement {summary(values)}")
+	if publish_latencies:
+		print(f"{'all':<14} post to publish      {summary(publish_latencies)}")
+	for kind, values in format_times(bot, args.format_runs).items():
+		print(f"{kind:<14} formatting           {summary(values)}")
+	print(f"Reddit requests: {feed_calls} in {polls} polls, {feed_calls / max(len(sent_at), 1):.1f} per post, "
+		  f"{edit_calls} to check {len(cog.edits)} posts for edits")
+	for failure in failures:
+		print(f"FAILED {failure}")
+	return 1 if failures else 0
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--gap", type=float, default=0.5, help="seconds between posts")
+	parser.add_argument("--interval", type=float, default=0.25, help="seconds between polls")
+	parser.add_argument("--send-interval", type=float, default=0.1, help="seconds between announcements")
+	parser.add_argument("--publish-window", type=float, default=8,
+						help="seconds for 10 publishes, an hour on Discord but shortened to see publishes wait for it")
+	parser.add_argument("--reddit-latency", type=float, default=0.05, help="seconds per Reddit request")
+	parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord request")
+	parser.add_argument("--max-latency", type=float, default=3, help="longest a post may take to be announced")
+	parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for the last announcements")
+	parser.add_argument("--format-runs", type=int, default=50, help="times to format each post when timing it")
+	args = parser.parse_args()
+	with tempfile.TemporaryDirectory() as tmp:
+		# the feed's stores are made in the working directory
+		os.chdir(tmp)
+		sys.exit(asyncio.run(replay(args)))
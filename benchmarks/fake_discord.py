@@ -0,0 +1,189 @@
+"""In-process stand-ins for the parts of nextcord the archiver uses, for benchmarking it without Discord
+
+Channels have a made up history of messages with attachments. Every history page, attachment download and send
+waits a set latency first, like a round trip to Discord would. Nothing is kept per message but its id, so a channel
+with a million messages only costs a list of ints."""
+import asyncio
+import bisect
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+import nextcord
+
+PAGE_SIZE = 100
+
+WORDS = ("the answer is probably a cipher but we haven't figured out the key yet, has anyone tried "
+         "reading the first letters of each clue or looking at the flavortext again").split()
+
+
+class FakeAuthor:
+    def __init__(self, id):
+        self.id = id
+        self.name = f"solver{id}"
+        self.display_name = f"Solver {id}"
+
+
+class FakeAttachment:
+    """An attachment whose bytes are made up when it's downloaded. Duplicates share their bytes with each other,
+    like the same image posted in several places"""
+
+    def __init__(self, id, size, latency, duplicate_of=None):
+        self.id = id
+        self.size = size
+        self.latency = latency
+        self.duplicate_of = duplicate_of
+        self.filename = f"image_{duplicate_of if duplicate_of is not None else id}.png"
+        self.url = f"https://cdn.example.com/attachments/{id}/{self.filename}"
+
+    async def read(self):
+        await asyncio.sleep(self.latency)
+        seed = self.duplicate_of if self.duplicate_of is not None else self.id
+        return random.Random(seed).randbytes(self.size)
+
+
+class FakeMessage:
+    def __init__(self, channel, id, author, content, attachments):
+        self.id = id
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.clean_content = content
+        self.attachments = attachments
+        self.created_at = nextcord.utils.snowflake_time(id)
+        self.edited_at = None
+        self.reference = None
+        self.reactions = []
+        self.embeds = []
+
+
+class FakeSentMessage:
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class FakeChannel:
+    """Stands in for a nextcord.TextChannel
+
+    Has `messages` messages spread evenly over the last `days` days. `attachment_rate` of them have an attachment of
+    `attachment_size` bytes, and `duplicate_ratio` of those attachments are one of a few images that keep getting
+    posted again. History pages take `latency` seconds and attachments take `attachment_latency` seconds to
+    download. Files sent to the channel are counted and closed, after `send_latency` seconds"""
+
+    def __init__(self, guild, id, name, messages=0, days=30, attachment_rate=0.1, attachment_size=100_000,
+                 duplicate_ratio=0.2, latency=0.05, attachment_latency=0.02, send_latency=0.1, category=None,
+                 seed=0):
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.mention = f"#{name}"
+        self.type = nextcord.ChannelType.text
+        self.category = category
+        self.latency = latency
+        self.attachment_latency = attachment_latency
+        self.send_latency = send_latency
+        self.requests = 0
+        self.files_sent = 0
+        self.bytes_sent = 0
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        start = nextcord.utils.time_snowflake(now - timedelta(days=days))
+        step = (nextcord.utils.time_snowflake(now) - start) // max(messages, 1)
+        self.ids = [start + i * step for i in range(messages)]
+        self.last_message_id = self.ids[-1] if self.ids else None
+        # Message id -> (attachment size, id of the image it duplicates or None)
+        self.attachments = {}
+        for id in self.ids:
+            if rng.random() < attachment_rate:
+                duplicate = rng.randrange(8) if rng.random() < duplicate_ratio else None
+                self.attachments[id] = (attachment_size, duplicate)
+
+    @property
+    def attachment_bytes(self):
+        return sum(size for size, _ in self.attachments.values())
+
+    def _message(self, id):
+        author = FakeAuthor(id % 7)
+        content = " ".join(WORDS[(id + i) % len(WORDS)] for i in range(id % 23 + 3))
+        attachments = []
+        if id in self.attachments:
+            size, duplicate = self.attachments[id]
+            attachments.append(FakeAttachment(id, size, self.attachment_latency, duplicate))
+        return FakeMessage(self, id, author, content, attachments)
+
+    async def history(self, limit=100, after=None, before=None, oldest_first=None):
+        """Like TextChannel.history, waiting `latency` seconds for every page of 100"""
+        low = bisect.bisect_right(self.ids, after.id) if after else 0
+        high = bisect.bisect_left(self.ids, before.id) if before else len(self.ids)
+        if limit is not None:
+            high = min(high, low + limit)
+        for page_start in range(low, high, PAGE_SIZE):
+            self.requests += 1
+            await asyncio.sleep(self.latency)
+            for id in self.ids[page_start:min(page_start + PAGE_SIZE, high)]:
+                yield self._message(id)
+
+    async def send(self, content=None, embed=None, file=None):
+        await asyncio.sleep(self.send_latency)
+        if file is not None:
+            self.files_sent += 1
+            self.bytes_sent += os.fstat(file.fp.fileno()).st_size
+            file.close()
+        return FakeSentMessage()
+
+
+class FakeCategory:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.mention = f"<#{id}>"
+        self.type = nextcord.ChannelType.category
+        self.text_channels = []
+
+
+class FakeGuild:
+    def __init__(self, id=1, name="Test Hunt", filesize_limit=8 * 1_048_576):
+        self.id = id
+        self.name = name
+        self.filesize_limit = filesize_limit
+        self.text_channels = []
+        self.categories = []
+
+    @property
+    def channels(self):
+        return self.categories + self.text_channels
+
+    def __str__(self):
+        return self.name
+
+
+class FakeBot:
+    def __init__(self, guild):
+        self.guild = guild
+        self.command_prefix = "!"
+
+    def get_guild(self, id):
+        return self.guild if id == self.guild.id else None
+
+    def get_channel(self, id):
+        return next((channel for channel in self.guild.channels if channel.id == id), None)
+
+
+def make_guild(channels, categories=1, **channel_options):
+    """A guild with `channels` channels of made up history, spread over `categories` categories. Takes the
+    FakeChannel options for every channel. Returns the guild and a channel to send archives to"""
+    guild = FakeGuild()
+    for number in range(categories):
+        guild.categories.append(FakeCategory(2000 + number, f"category-{number}"))
+    for number in range(channels):
+        category = guild.categories[number % categories] if categories else None
+        channel = FakeChannel(guild, 1000 + number, f"channel-{number}", category=category, seed=number,
+                              **channel_options)
+        guild.text_channels.append(channel)
+        if category is not None:
+            category.text_channels.append(channel)
+    destination = FakeChannel(guild, 999, "archives", send_latency=channel_options.get('send_latency', 0.1))
+    return guild, destination
@@ -0,0 +1,160 @@
+"""In-process stand-ins for asyncpraw and an announcements channel, for running the Reddit feed without either service
+
+FakeReddit serves a subreddit whose posts are replayed from recordings, one at a time. It counts every request the
+feed makes, so the harness can report API calls per post. FakeAnnouncementsChannel records when each announcement
+is sent, edited and published."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from benchmarks.bench_markdown_tables import results_post
+
+SCHEDULE = """The theme of this week's hunt is: The Lost Library of Alexandria
+
+Welcome back, puzzlers! Here's the schedule for this round.
+
+Puzzle|Release|Ends|
+:-:|:-:|:-:|
+Puzzle 1|Friday, January 5, 6:00 PM EST|Sunday, January 7, 6:00 PM EST|
+Puzzle 2|Saturday, January 6, 6:00 PM EST|Monday, January 8, 6:00 PM EST|
+Puzzle 3|Sunday, January 7, 6:00 PM EST|Tuesday, January 9, 6:00 PM EST|
+Puzzle 4|Monday, January 8, 6:00 PM EST|Wednesday, January 10, 6:00 PM EST|
+Puzzle 5|Tuesday, January 9, 6:00 PM EST|Thursday, January 11, 6:00 PM EST|
+
+Good luck, and remember to submit your answers through the form!"""
+
+PUZZLE = ("The librarian left a note tucked between the pages of a book on arithmancy. It reads: "
+		  "\"Seven scrolls, seven shelves, and only one of them is where it should be.\" ") * 12 + \
+		 "\n\nHint: >!count the letters on each shelf!<\n\nSubmit your answer with the form linked in the sidebar."
+
+
+def recorded_posts():
+	"""(kind, title, selftext) of a hunt's worth of posts, in the order they went up"""
+	posts = [("announcements", "Hunt Announcements: The Lost Library", SCHEDULE)]
+	for level in range(1, 6):
+		posts.append(("puzzle", f"Puzzle {level}: Shelf {level}", PUZZLE))
+		posts.append(("results", f"Level {level} Results", results_post(level)))
+	return posts
+
+
+class FakeSubmission:
+	def __init__(self, id, title, selftext):
+		self.id = id
+		self.fullname = f"t3_{id}"
+		self.title = title
+		self.selftext = selftext
+		self.subreddit = SimpleNamespace(display_name="Arithmancy")
+		self.author = "puzzlemaster"
+		self.created_utc = time.time()
+		self.edited = False
+
+	def edit(self, selftext):
+		self.selftext = selftext
+		self.edited = time.time()
+
+
+class FakeSubreddit:
+	def __init__(self, reddit):
+		self.reddit = reddit
+
+	async def new(self, limit=100):
+		"""newest posts first, one request per call"""
+		self.reddit.calls["new"] += 1
+		await asyncio.sleep(self.reddit.latency)
+		for submission in list(reversed(self.reddit.posts))[:limit]:
+			yield submission
+
+
+class FakeReddit:
+	"""Stands in for the asyncpraw.Reddit instance in modules.reddit_feed.cog. Requests take `latency` seconds"""
+
+	def __init__(self, latency=0.05):
+		self.latency = latency
+		self.posts = []
+		# post id -> time it went up, for measuring how long it took to be announced
+		self.posted_at = {}
+		self.calls = {"new": 0, "info": 0, "submission": 0}
+		self._core = SimpleNamespace(_rate_limiter=SimpleNamespace(remaining=None, reset_timestamp=None))
+		self._ids = iter(range(1, 1_000_000))
+
+	def post(self, title, selftext):
+		submission = FakeSubmission(f"p{next(self._ids):05d}", title, selftext)
+		self.posts.append(submission)
+		self.posted_at[submission.id] = time.perf_counter()
+		return submission
+
+	@property
+	def api_calls(self):
+		return sum(self.calls.values())
+
+	async def subreddit(self, name):
+		# asyncpraw makes subreddits lazily, without a request
+		return FakeSubreddit(self)
+
+	async def submission(self, id):
+		self.calls["submission"] += 1
+		await asyncio.sleep(self.latency)
+		return next(submission for submission in self.posts if submission.id == id)
+
+	async def info(self, fullnames):
+		"""every post in fullnames, in one request"""
+		self.calls["info"] += 1
+		await asyncio.sleep(self.latency)
+		ids = {fullname[3:] for fullname in fullnames}
+		for submission in self.posts:
+			if submission.id in ids:
+				yield submission
+
+
+class FakeMessage:
+	def __init__(self, channel, id, embed):
+		self.channel = channel
+		self.id = id
+		self.embed = embed
+
+	async def edit(self, embed):
+		await asyncio.sleep(self.channel.latency)
+		self.embed = embed
+		self.channel.edits.append((self.id, time.perf_counter()))
+
+	async def publish(self):
+		await asyncio.sleep(self.channel.latency)
+		self.channel.published.append((self.id, time.perf_counter()))
+
+
+class FakeAnnouncementsChannel:
+	"""A news channel that keeps every announcement sent to it. Requests take `latency` seconds"""
+
+	def __init__(self, id, latency=0.05):
+		self.id = id
+		self.latency = latency
+		self.messages = {}
+		# (message id, time) of every send, edit and publish
+		self.sent = []
+		self.edits = []
+		self.published = []
+
+	def is_news(self):
+		return True
+
+	async def send(self, embed):
+		await asyncio.sleep(self.latency)
+		message = FakeMessage(self, len(self.messages) + 1, embed)
+		self.messages[message.id] = message
+		self.sent.append((message.id, time.perf_counter()))
+		return message
+
+	async def fetch_message(self, id):
+		await asyncio.sleep(self.latency)
+		return self.messages[id]
+
+	def get_partial_message(self, id):
+		return self.messages[id]
+
+
+class FakeBot:
+	def __init__(self, channel):
+		self.channel = channel
+
+	def get_channel(self, id):
+		return self.channel if id == self.channel.id else None
@@ -0,0 +1,36 @@
+import asyncio
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep, i.e. how long it was blocked for"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.max_lag = 0
+        self.total_lag = 0
+        self.samples = 0
+        self._task = None
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            self.samples += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / self.samples if self.samples else 0
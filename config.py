@@ -3,6 +3,11 @@ import os
 
 load_dotenv()
 
+# Directory the bot keeps what it needs after a restart in, like unfinished archive jobs and the Reddit feed's seen
+# posts and outbox. It has to be persistent storage, eg. a mounted volume, since a Heroku dyno's filesystem is wiped
+# whenever the dyno restarts
+STATE_DIR = os.getenv("STATE_DIR", ".")
+
 # Discord config
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 BOT_PREFIX = "!"
@@ -14,12 +19,24 @@ CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 SUB = os.getenv("REDDIT_SUB", "Arithmancy")
 
+# Archive download server (optional). Archives too big to attach are linked from here instead
+ARCHIVE_DOWNLOAD_URL = os.getenv("ARCHIVE_DOWNLOAD_URL")
+ARCHIVE_DOWNLOAD_SECRET = os.getenv("ARCHIVE_DOWNLOAD_SECRET")
+ARCHIVE_DOWNLOAD_PORT = int(os.getenv("PORT", os.getenv("ARCHIVE_DOWNLOAD_PORT", "8080")))
+
 # Guild
 GUILD_ID = int(os.getenv("DISCORD_GUILD_ID"))
 
 # Announcements channel
 ANNOUNCEMENTS_CHANNEL_ID = int(os.getenv("DISCORD_ANNOUNCEMENTS_CHANNEL"))
 
+# Subreddits to follow and the channel to announce each one's posts in, as "sub=channel_id,sub=channel_id".
+# Without it, posts in SUB are announced in ANNOUNCEMENTS_CHANNEL_ID
+REDDIT_FEEDS = {
+    sub.strip().lower(): int(channel_id)
+    for sub, channel_id in (feed.split("=") for feed in os.getenv("REDDIT_FEEDS", "").split(",") if feed.strip())
+} or {SUB.lower(): ANNOUNCEMENTS_CHANNEL_ID}
+
 # Roles
 MYSTERY_HUNT_ROLE_ID = 788526627440689242 # Arithmancy
 VERIFIED_PUZZLER_ROLE_ID = 812906479794520135 # Team Arithmancy
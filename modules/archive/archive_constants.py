@@ -5,3 +5,44 @@
 ARCHIVE = 'archive'
 IMAGES = 'images'
 TEXT_LOG_PATH = 'text_log.txt'
+TEXT_LOG_BUFFER_SIZE = 65_536 # characters of chat log to collect before writing them out
+DEFAULT_COMPRESSION = 'default' # one of the policies in compression.POLICIES
+ZIP_ENTRY_OVERHEAD = 128 # approximate bytes of zip headers per file, used to estimate the zip size
+SPLIT_HEADROOM = 262_144 # bytes each part is kept under the upload limit by, in case the size estimate is off
+
+JOB_CONCURRENCY = 2 # archive commands run at the same time, the rest wait in the queue
+CHANNEL_CONCURRENCY = 4 # channels archived at the same time, across all running jobs
+PROGRESS_INTERVAL = 20 # seconds between edits of a job's progress embed
+# Kept outside of the archive directory, which gets wiped
+CHECKPOINTS_PATH = 'archive_checkpoints.json'
+JOBS_PATH = 'archive_jobs.json' # jobs that haven't finished, picked back up after a restart
+
+# Shrinking images (--transcode, needs Pillow)
+TRANSCODE_PROCESSES = 2 # worker processes shrinking images, shared by every archive
+TRANSCODE_THRESHOLD = 1_048_576 # bytes an image has to be over to get shrunk
+TRANSCODE_TARGET = 524_288 # bytes a shrunk image ends up under
+THUMBNAIL_SIZE = 256 # pixels on the longest side of a thumbnail
+THUMBNAIL_RESERVE = 32_768 # bytes set aside for a thumbnail while it's being made
+
+# Download server for archives too big to attach (--download, needs ARCHIVE_DOWNLOAD_URL and ARCHIVE_DOWNLOAD_SECRET)
+DOWNLOADS_PATH = 'archive_downloads' # in config.STATE_DIR, outside of the archive directory, so links survive a restart
+DOWNLOAD_LINK_TTL = 3 * 24 * 60 * 60 # seconds a download link works for
+DOWNLOAD_RETENTION = 7 * 24 * 60 * 60 # seconds an archive is kept for
+DOWNLOAD_QUOTA = 2 * 1024 ** 3 # bytes of archives kept at most, the oldest are deleted first
+DOWNLOAD_CLEANUP_INTERVAL = 60 * 60 # seconds between deleting archives past their retention
+
+# Search
+SEARCH_INDEX_PATH = 'archive_index.sqlite3' # in config.STATE_DIR, outside of the archive directory too
+INDEX_BATCH_SIZE = 500 # messages to collect before adding them to the search index
+SEARCH_PAGE_SIZE = 10 # results per page of !searcharchive
+
+# Reading channel history
+HISTORY_SLICES = 128 # most stretches of time a big channel's history is cut into
+HISTORY_CONCURRENCY = 8 # slices of one channel read at the same time
+HISTORY_BUFFER = 1_000 # messages read ahead per slice, waiting for the slices before it to be written
+HISTORY_REQUESTS = 16 # history requests in flight at the same time, across every channel being archived
+
+# Attachment downloads
+DOWNLOAD_CONCURRENCY = 8 # attachments downloaded at the same time
+DOWNLOAD_RETRIES = 3 # times to retry a failed download
+DOWNLOAD_BACKOFF = 1 # seconds to wait before the first retry, doubled every attempt
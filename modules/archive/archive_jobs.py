@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import time
+
+from modules.error_log.error_handler import ErrorHandler
+
+from . import archive_constants
+from .archive_utils import ArchiveOptions
+
+# Lower numbers run first
+PRIORITY_CHANNEL = 0
+PRIORITY_CATEGORY = 1
+PRIORITY_SERVER = 2
+
+
+class ArchiveProgress:
+    """Running totals for an archive job, shown in its progress embed"""
+
+    def __init__(self, total_channels):
+        self.total_channels = total_channels
+        self.channels_done = 0
+        self.messages = 0
+        self.attachments = 0
+        self.started = None
+        # Size of the zips of channels that are done
+        self._bytes_done = 0
+        # Writers of the channels being archived right now
+        self.writers = set()
+
+    def start(self):
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0
+
+    @property
+    def messages_per_second(self):
+        return self.messages / self.elapsed if self.elapsed else 0
+
+    @property
+    def bytes_written(self):
+        return self._bytes_done + sum(writer.bytes_written for writer in self.writers)
+
+    def channel_started(self, writer):
+        self.writers.add(writer)
+
+    def channel_finished(self, writer):
+        self.writers.discard(writer)
+        self._bytes_done += writer.zip_size
+
+
+class ArchiveJob:
+    """One archive command: a list of channels to archive and where to send the results"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, destination, guild, author, target, channels, options, priority, retry_hint):
+        self.id = None
+        # Channel the archives get sent to
+        self.destination = destination
+        self.guild = guild
+        self.author = author
+        # The channel, category or guild being archived
+        self.target = target
+        self.channels = channels
+        self.options = options
+        self.priority = priority
+        self.retry_hint = retry_hint
+        self.status = self.QUEUED
+        self.progress = ArchiveProgress(len(channels))
+        self.task = None
+        # Message telling the user the job is waiting in line, deleted once it starts
+        self.delay_message = None
+        # Ids of the channels that have been archived and sent
+        self.done_channels = set()
+        # Channel id (as a string, like json keys) -> how far its archive got, for channels that are partway through
+        self.channel_states = {}
+
+    @property
+    def target_name(self):
+        return self.target.mention if hasattr(self.target, 'mention') else str(self.target)
+
+    def to_dict(self):
+        """Everything needed to pick the job back up after a restart, as something json can store"""
+        return {
+            'id': self.id,
+            'destination': self.destination.id,
+            'guild': self.guild.id,
+            'author': str(self.author),
+            # A channel, category or guild, or the mentions of several channels
+            'target': self.target.id if hasattr(self.target, 'id') else self.target,
+            'channels': [channel.id for channel in self.channels],
+            'options': vars(self.options),
+            'priority': self.priority,
+            'retry_hint': self.retry_hint,
+            'done_channels': list(self.done_channels),
+            'channel_states': self.channel_states,
+        }
+
+    @classmethod
+    def from_dict(cls, data, bot):
+        """Rebuild a job saved with to_dict. Returns None if the guild or the channel to send to is gone"""
+        guild = bot.get_guild(data['guild'])
+        destination = bot.get_channel(data['destination'])
+        if guild is None or destination is None:
+            return None
+        target = data['target']
+        if isinstance(target, int):
+            target = bot.get_channel(target) or bot.get_guild(target)
+        # Channels deleted since don't need archiving anymore
+        channels = [channel for channel in map(bot.get_channel, data['channels']) if channel is not None]
+        job = cls(destination, guild, data['author'], target, channels, ArchiveOptions(**data['options']),
+                  data['priority'], data['retry_hint'])
+        job.id = data['id']
+        job.done_channels = set(data['done_channels'])
+        job.channel_states = data['channel_states']
+        job.progress.channels_done = sum(1 for channel in channels if channel.id in job.done_channels)
+        return job
+
+
+class ArchiveQueue:
+    """Runs archive jobs in priority order, a few at a time
+
+    Single channels go ahead of categories, which go ahead of whole servers. Jobs with the same priority run in
+    the order they were submitted."""
+
+    def __init__(self, run_job, workers=archive_constants.JOB_CONCURRENCY, first_id=1):
+        self.run_job = run_job
+        self.workers = workers
+        # Every job that is queued or running, by id
+        self.jobs = {}
+        self._ids = itertools.count(first_id)
+        self._queue = None
+        self._worker_tasks = []
+
+    def submit(self, job):
+        """Add a job to the queue, returning how many queued jobs are ahead of it"""
+        if self._queue is None:
+            # Created here rather than in __init__ since the cog is loaded before the event loop is running
+            self._queue = asyncio.PriorityQueue()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Jobs picked back up after a restart keep their id
+        if job.id is None:
+            job.id = next(self._ids)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((job.priority, job.id, job))
+        return self.position(job)
+
+    def position(self, job):
+        """Number of queued jobs that will start before this one"""
+        return sum(1 for other in self.jobs.values()
+                   if other.status == ArchiveJob.QUEUED and (other.priority, other.id) < (job.priority, job.id))
+
+    def is_busy(self):
+        """Whether a new job would have to wait for a worker"""
+        return sum(1 for job in self.jobs.values() if job.status == ArchiveJob.RUNNING) >= self.workers
+
+    def cancel(self, job_id):
+        """Cancel a job, whether it is still waiting or already running. Returns the job, or None if there isn't one"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status == ArchiveJob.CANCELLED:
+            return None
+        if job.status == ArchiveJob.RUNNING:
+            job.status = ArchiveJob.CANCELLED
+            job.task.cancel()
+        else:
+            # The worker skips it when it comes up
+            job.status = ArchiveJob.CANCELLED
+            del self.jobs[job_id]
+        return job
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status == ArchiveJob.CANCELLED:
+                continue
+            job.status = ArchiveJob.RUNNING
+            job.task = asyncio.create_task(self.run_job(job))
+            # Wait without letting the job's cancellation (or errors) stop the worker
+            await asyncio.wait([job.task])
+            if not job.task.cancelled() and job.task.exception():
+                # Raised again so the error log gets the traceback, like the errors from each channel
+                try:
+                    raise job.task.exception()
+                except Exception as error:
+                    await ErrorHandler("", error, f"Error while running archive job {job.id}").handle_error()
+            job.status = ArchiveJob.CANCELLED if job.task.cancelled() else ArchiveJob.DONE
+            self.jobs.pop(job.id, None)
@@ -1,13 +1,17 @@
 from modules.archive import archive_constants
+from modules.archive.compression import POLICIES
+from modules.archive.message_record import EXPORT_FORMATS
 from utils import discord_utils
-import os, shutil
+import os, shutil, tempfile
 
 
-def get_delay_embed():
+def get_delay_embed(job_id, position, prefix):
     embed = discord_utils.create_embed()
     embed.add_field(name="Warning: Delay!",
-                    value="Hi! It appears we're a little busy at the moment, so our archiving may take a while. "
-                          "Sorry about that! We'll get to it as soon as possible.",
+                    value=f"Hi! It appears we're a little busy at the moment, so our archiving may take a while. "
+                          f"Sorry about that! We'll get to it as soon as possible. Your archive is job {job_id}, "
+                          f"and it's number {position + 1} in line. You can check on it with `{prefix}archivestatus`, "
+                          f"or cancel it with `{prefix}archivecancel {job_id}`.",
                     inline=False)
     return embed
 
@@ -17,4 +21,94 @@ def reset_archive_dir():
     if os.path.exists(archive_constants.ARCHIVE):
         shutil.rmtree(archive_constants.ARCHIVE)
     os.mkdir(archive_constants.ARCHIVE)
-    os.mkdir(os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES))
\ No newline at end of file
+    os.mkdir(os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES))
+
+
+def make_job_dir():
+    # Make a working directory inside the archive directory for a single channel
+    return tempfile.mkdtemp(dir=archive_constants.ARCHIVE)
+
+
+def remove_job_dir(job_dir):
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+
+class ArchiveOptions:
+    """Options that change how channels get archived, set with flags like `--incremental`"""
+
+    def __init__(self, incremental=False, compression=archive_constants.DEFAULT_COMPRESSION, split=True,
+                 export=None, index=False, transcode=False, download=False):
+        # Only archive messages sent since the last time the channel was archived
+        self.incremental = incremental
+        # Name of the CompressionPolicy to use
+        self.compression = compression
+        # Send channels that don't fit under the upload limit in several parts, instead of linking attachments
+        self.split = split
+        # Name of the format to also export every message in, one of message_record.EXPORT_FORMATS
+        self.export = export
+        # Add the archived messages to the search index, for !searcharchive
+        self.index = index
+        # Shrink big images so more of them fit (needs Pillow)
+        self.transcode = transcode
+        # Build one zip per channel with everything in it, and send a download link if it's too big to attach
+        self.download = download
+
+
+def parse_archive_args(args):
+    """Split a command's arguments into names and ArchiveOptions
+
+    Raises ValueError for flags we don't know about"""
+    names = []
+    options = ArchiveOptions()
+    for arg in args:
+        if arg in ('--incremental', '-i'):
+            options.incremental = True
+        elif arg == '--download':
+            options.download = True
+        elif arg == '--transcode':
+            options.transcode = True
+        elif arg == '--index':
+            options.index = True
+        elif arg == '--nosplit':
+            options.split = False
+        elif arg.startswith('--compression=') and arg.split('=', 1)[1] in POLICIES:
+            options.compression = arg.split('=', 1)[1]
+        elif arg.startswith('--export=') and arg.split('=', 1)[1] in EXPORT_FORMATS:
+            options.export = arg.split('=', 1)[1]
+        elif arg.startswith('--'):
+            raise ValueError(arg)
+        else:
+            names.append(arg)
+    return names, options
+
+
+def get_unknown_option_embed(option):
+    embed = discord_utils.create_embed()
+    embed.add_field(name="ERROR: Unknown option",
+                    value=f"Sorry, I don't know the option `{option}`. You can use `--incremental` to only "
+                          f"archive messages sent since the last archive, "
+                          f"`--compression={'|'.join(POLICIES)}` to choose how hard to compress, `--nosplit` "
+                          f"to send one zip per channel, linking the attachments that don't fit, "
+                          f"`--export={'|'.join(EXPORT_FORMATS)}` to also save every message in a structured file, "
+                          f"`--index` to make the messages searchable with `!searcharchive`, `--transcode` to "
+                          f"shrink big images so more of them fit, and `--download` to get a download link for "
+                          f"archives too big to attach.",
+                    inline=False)
+    return embed
+
+
+def parse_search_args(args):
+    """Split !searcharchive's arguments into the query and the page number
+
+    Raises ValueError if the page isn't a positive number"""
+    page = 1
+    words = []
+    for arg in args:
+        if arg.startswith('--page='):
+            page = arg.split('=', 1)[1]
+            if not page.isdigit() or int(page) < 1:
+                raise ValueError(arg)
+            page = int(page)
+        else:
+            words.append(arg)
+    return " ".join(words), page
@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import os
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import archive_constants
+from .compression import POLICIES
+from .message_record import EXPORT_FORMATS
+
+
+class ArchiveWriter:
+    """Streams a channel's chat log and attachments into a single zip file
+
+    The zip is opened once and every attachment is appended to it as soon as it is downloaded, so attachment
+    bytes are written to disk exactly once. Attachments are stored by content, so reposts of the same file
+    are only stored once and the chat log points every repost at the same name. The chat log is kept as its
+    own file so that it can still be sent by itself if the zip ends up being too big. How each file is
+    compressed is up to the CompressionPolicy.
+
+    If an export_format is given (one of message_record.EXPORT_FORMATS), a structured record of every message is
+    streamed into its own file next to the chat log as well.
+
+    Compressing and writing to disk happen on a thread of the writer's own, so a big archive doesn't block the
+    event loop (zlib and hashlib release the GIL while they work). Using a single thread keeps every write to the
+    zip in the order it was made."""
+
+    def __init__(self, directory, archive_name, policy=POLICIES[archive_constants.DEFAULT_COMPRESSION], filenames=(),
+                 previous=None, export_format=None):
+        self.policy = policy
+        self.zip_path = os.path.join(directory, archive_name + '_archive.zip')
+        self.text_log_name = archive_name + '_' + archive_constants.TEXT_LOG_PATH
+        self.text_log_path = os.path.join(directory, self.text_log_name)
+        self.text_log_size = 0
+        self.export_format = export_format
+        if export_format is not None:
+            self.export_name = self._export_name(archive_name)
+            self.export_path = os.path.join(directory, self.export_name)
+            self.export = open(self.export_path, 'wb')
+            # Encoded records that haven't been handed to the writer thread yet
+            self._records = []
+        else:
+            self.export_name = self.export_path = None
+        self.zip_size = 0
+        # Bytes of every file in the zip before compression, and seconds spent compressing them
+        self.uncompressed_size = 0
+        self.compress_time = 0
+        # Number of attachments that were left in the chat log as links instead of being added to the zip
+        self.linked = 0
+        # Compressing the chat log as it is written tells us roughly how much space it will take up in the zip
+        self._text_compressor = zlib.compressobj()
+        self._text_compressed_size = 0
+        # zlib holds on to input until it has a full block, so count whatever it hasn't compressed yet at full size
+        self._text_uncompressed_size = 0
+        # Chat log lines (and export records) that haven't been handed to the writer thread yet
+        self._lines = []
+        self._lines_size = 0
+        # Names of the attachments already in the zip (or in earlier archives of the channel), used to rename duplicates
+        self.filenames = set(filenames)
+        # Next number to try for each duplicated filename
+        self._dupe_counters = {}
+        # Content hash -> name, so identical files are only stored once
+        self._contents = {}
+        # Number of attachments that were identical to one already in the zip
+        self.duplicates = 0
+        if previous is not None:
+            # This zip is the next part of the same archive. Carry on naming (and deduplicating) from the previous
+            # part, so a name in the chat log of any part points at exactly one file across all the parts
+            self.filenames = previous.filenames
+            self._dupe_counters = previous._dupe_counters
+            self._contents = previous._contents
+        # Attachment id -> name it was stored under, for every attachment added to this zip
+        self.attachments = {}
+        # The messages whose chat log lines are in this zip
+        self.messages = 0
+        self.first_message_at = None
+        self.last_message_at = None
+        self.last_message_id = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.zf = zipfile.ZipFile(self.zip_path, mode='w')
+        self.text_log = open(self.text_log_path, 'w', encoding='utf-8')
+
+    async def _run(self, func, *args):
+        """Run func on the writer thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def write_line(self, line):
+        """Append one line to the chat log"""
+        self._lines.append(line + "\n")
+        self._lines_size += len(line) + 1
+        # Lines are written in batches, so we aren't handing every single line to the writer thread
+        if self._lines_size >= archive_constants.TEXT_LOG_BUFFER_SIZE:
+            await self._flush_lines()
+
+    async def _flush_lines(self):
+        lines = "".join(self._lines)
+        self._lines = []
+        records = b""
+        if self.export_format is not None:
+            records = b"".join(self._records)
+            self._records = []
+        self._lines_size = 0
+        await self._run(self._write_text, lines, records)
+
+    def message_written(self, message):
+        """Note that a message's chat log line has been written, and add its MessageRecord to the export"""
+        if self.export_format is not None:
+            data = EXPORT_FORMATS[self.export_format][1](message)
+            self._records.append(data)
+            self._lines_size += len(data)
+        self.messages += 1
+        if self.first_message_at is None:
+            self.first_message_at = message.created_at
+        self.last_message_at = message.created_at
+        self.last_message_id = message.id
+
+    def _write_text(self, text, records=b""):
+        self.text_log.write(text)
+        data = text.encode('utf-8')
+        if records:
+            self.export.write(records)
+            data += records
+        if self.policy.for_text_log()[0] == zipfile.ZIP_STORED:
+            # The chat log won't be compressed at all
+            self._text_uncompressed_size += len(data)
+            return
+        compressed = len(self._text_compressor.compress(data))
+        if compressed:
+            self._text_compressed_size += compressed
+            self._text_uncompressed_size = 0
+        else:
+            self._text_uncompressed_size += len(data)
+
+    def projected_size(self):
+        """Estimate how big the zip would be if it were closed right now"""
+        # Local headers and data written so far, plus the chat log and a central directory entry per file
+        return (self.zf.fp.tell() + self._text_compressed_size + self._text_uncompressed_size + self._lines_size
+                + archive_constants.ZIP_ENTRY_OVERHEAD * (len(self.zf.filelist) + 1))
+
+    @property
+    def bytes_written(self):
+        """Size of the zip on disk so far"""
+        return self.zf.fp.tell() if self.zf.fp else self.zip_size
+
+    def is_empty(self):
+        return not self.messages and not self.zf.filelist
+
+    async def add_attachment(self, filename, data, attachment_id=None):
+        """Append an attachment to the zip, returning the (possibly renamed) filename it was stored under.
+        If the exact same bytes are already in the zip, nothing is written and the existing name is returned"""
+        name = await self._run(self._add_attachment, filename, data)
+        if attachment_id is not None:
+            self.attachments[str(attachment_id)] = name
+        return name
+
+    def _add_attachment(self, filename, data):
+        digest = hashlib.sha256(data).digest()
+        name = self._contents.get(digest)
+        if name is None:
+            name = self._unique_name(filename)
+            compress_type, compresslevel = self.policy.for_attachment(name)
+            start = time.perf_counter()
+            self.zf.writestr(os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES, name), data,
+                             compress_type=compress_type, compresslevel=compresslevel)
+            self.compress_time += time.perf_counter() - start
+            self.uncompressed_size += len(data)
+            self._contents[digest] = name
+        else:
+            self.duplicates += 1
+        return name
+
+    def _unique_name(self, filename):
+        """Pick a name that hasn't been used yet. img.png would become img (1).png, then img (2).png, ..."""
+        if filename not in self.filenames:
+            self.filenames.add(filename)
+            return filename
+        root, ext = os.path.splitext(filename)
+        # Start counting where we left off last time, instead of trying every number from 1 again
+        dupe_counter = self._dupe_counters.get(filename, 1)
+        name = f"{root} ({dupe_counter}){ext}"
+        while name in self.filenames:
+            dupe_counter += 1
+            name = f"{root} ({dupe_counter}){ext}"
+        self._dupe_counters[filename] = dupe_counter + 1
+        self.filenames.add(name)
+        return name
+
+    async def close(self, archive_name=None):
+        """Finish the chat log, add it to the zip and close everything.
+        If archive_name is given, the zip and the chat log inside it are renamed to go with it"""
+        if self.text_log.closed:
+            return
+        await self._flush_lines()
+        await self._run(self._close, archive_name)
+        self._executor.shutdown(wait=False)
+
+    def _close(self, archive_name=None):
+        if archive_name is not None:
+            self.text_log_name = archive_name + '_' + archive_constants.TEXT_LOG_PATH
+            if self.export_format is not None:
+                self.export_name = self._export_name(archive_name)
+        self.text_log_size = self.text_log.tell()
+        self.text_log.close()
+        if self.export_format is not None:
+            self.export.close()
+        start = time.perf_counter()
+        self._write_logs(self.zf)
+        self.compress_time += time.perf_counter() - start
+        self.uncompressed_size += self._logs_size()
+        self.zf.close()
+        if archive_name is not None:
+            zip_path = os.path.join(os.path.dirname(self.zip_path), archive_name + '_archive.zip')
+            os.replace(self.zip_path, zip_path)
+            self.zip_path = zip_path
+        self.zip_size = os.path.getsize(self.zip_path)
+
+    async def keep_only_text_log(self):
+        """Replace the zip with one that only holds the chat log"""
+        await asyncio.get_running_loop().run_in_executor(None, self._keep_only_text_log)
+
+    def _keep_only_text_log(self):
+        with zipfile.ZipFile(self.zip_path, mode='w') as zf:
+            self._write_logs(zf)
+        self.zip_size = os.path.getsize(self.zip_path)
+        self.uncompressed_size = self._logs_size()
+
+    def _write_logs(self, zf):
+        """Add the chat log, and the export if there is one, to a zip"""
+        compress_type, compresslevel = self.policy.for_text_log()
+        zf.write(self.text_log_path, arcname=os.path.join(archive_constants.ARCHIVE, self.text_log_name),
+                 compress_type=compress_type, compresslevel=compresslevel)
+        if self.export_format is not None:
+            zf.write(self.export_path, arcname=os.path.join(archive_constants.ARCHIVE, self.export_name),
+                     compress_type=compress_type, compresslevel=compresslevel)
+
+    def _logs_size(self):
+        if self.export_format is None:
+            return self.text_log_size
+        return self.text_log_size + os.path.getsize(self.export_path)
+
+    def _export_name(self, archive_name):
+        return f"{archive_name}_messages.{EXPORT_FORMATS[self.export_format][0]}"
+
+    def remove_files(self):
+        """Delete the zip, chat log and export from disk once they've been sent"""
+        for path in (self.zip_path, self.text_log_path, self.export_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,179 @@
+import asyncio
+from collections import deque
+
+import aiohttp
+import nextcord
+
+from . import archive_constants, transcode
+
+# How an attachment goes into the archive
+FULL = 'full'
+SHRINK = 'shrink' # downscaled and recompressed
+THUMBNAIL = 'thumbnail' # only a small preview is stored, next to the link
+
+
+class AttachmentPool:
+    """Downloads attachments concurrently while the channel history is still being read
+
+    Messages are handed to the pool in history order. Their attachments start downloading straight away, but
+    messages are only written to the archive once every attachment before them has been written, so filenames
+    are assigned in the same order as a one-at-a-time download would assign them.
+
+    If a size limit is given, attachments are only downloaded while the projected size of the zip (using the size
+    Discord reports for each attachment) stays under it. Attachments that wouldn't fit are linked in the chat log
+    instead. When the writer splits the archive into parts (split=True), each attachment only has to fit in a part
+    by itself.
+
+    With a Transcoder, big images are shrunk on the way in, which takes far less space than keeping them as sent
+    and lets many more of them fit. An image that doesn't fit even then is linked with a thumbnail stored in the zip,
+    if there's room for that."""
+
+    def __init__(self, writer, size_limit=None, progress=None, split=False, transcoder=None,
+                 concurrency=archive_constants.DOWNLOAD_CONCURRENCY,
+                 retries=archive_constants.DOWNLOAD_RETRIES,
+                 backoff=archive_constants.DOWNLOAD_BACKOFF):
+        self.writer = writer
+        self.retries = retries
+        self.backoff = backoff
+        self.size_limit = size_limit
+        self.split = split
+        self.transcoder = transcoder
+        self.progress = progress
+        self.failed = 0
+        # Bytes of attachments that are downloading or waiting to be written, not yet counted by the writer
+        self._reserved = 0
+        # Limits how many downloads hit the CDN at the same time
+        self._slots = asyncio.Semaphore(concurrency)
+        # Limits how many downloaded attachments are held in memory waiting for their turn to be written
+        self._max_buffered = concurrency * 4
+        self._buffered = 0
+        # Messages waiting to be written, oldest first.
+        # Each one is [line, attachments, download tasks, bytes reserved for each, record]
+        self._pending = deque()
+
+    async def add_message(self, line, attachments, record=None):
+        """Queue a chat log line and start downloading its attachments. Once the line has been written, the writer
+        is handed the message's MessageRecord, with the names the attachments were stored under filled in"""
+        while self._pending and self._buffered >= self._max_buffered:
+            await self._write_oldest()
+        tasks = []
+        sizes = []
+        for attachment in attachments:
+            how, size = self._plan(attachment)
+            self._reserved += size
+            sizes.append(size)
+            tasks.append(asyncio.create_task(self._fetch(attachment, how)) if how is not None else None)
+        self._buffered += len(tasks)
+        self._pending.append([line, attachments, tasks, sizes, record])
+        # Write out everything at the front of the queue that has finished downloading
+        while self._pending and all(task is None or task.done() for task in self._pending[0][2]):
+            await self._write_oldest()
+
+    async def finish(self):
+        """Wait for the remaining downloads and write out every queued message"""
+        while self._pending:
+            await self._write_oldest()
+
+    def cancel(self):
+        """Stop all downloads that haven't finished yet"""
+        for _, _, tasks, _, _ in self._pending:
+            for task in tasks:
+                if task is not None:
+                    task.cancel()
+        self._pending.clear()
+        self._buffered = 0
+        self._reserved = 0
+
+    def _plan(self, attachment):
+        """Decide how an attachment goes into the archive. Returns (FULL, SHRINK or THUMBNAIL, bytes to set aside
+        for it), or (None, 0) if it can only be linked"""
+        image = self.transcoder is not None and transcode.is_image(attachment.filename)
+        if image and attachment.size > archive_constants.TRANSCODE_THRESHOLD:
+            options = [(SHRINK, archive_constants.TRANSCODE_TARGET)]
+        else:
+            options = [(FULL, attachment.size)]
+        if image:
+            options.append((THUMBNAIL, archive_constants.THUMBNAIL_RESERVE))
+        for how, size in options:
+            if self._fits(size):
+                return how, size
+        return None, 0
+
+    def _fits(self, size):
+        """Check if an attachment of size bytes can be added without the zip going over the size limit"""
+        if self.size_limit is None:
+            return True
+        if self.split:
+            return size + archive_constants.ZIP_ENTRY_OVERHEAD <= self.size_limit
+        return self.writer.projected_size() + self._reserved + size <= self.size_limit
+
+    async def _write_oldest(self):
+        line, attachments, tasks, sizes, record = self._pending.popleft()
+        for attachment, task, size in zip(attachments, tasks, sizes):
+            if task is None:
+                # Too big for the size limit
+                self.writer.linked += 1
+                result = None
+            else:
+                result = await task
+                self._reserved -= size
+            if result is None:
+                # Leave a link in the chat log so the attachment can still be found later
+                name = attachment.url
+                line += f" {name}"
+            else:
+                filename, data, how = result
+                stored = await self.writer.add_attachment(filename, data, attachment.id)
+                if how == THUMBNAIL:
+                    self.writer.linked += 1
+                    name = attachment.url
+                    line += f" {name} (thumbnail: {stored})"
+                else:
+                    name = stored
+                    line += f" {name}"
+            if record is not None:
+                record.attachments.append(name)
+        await self.writer.write_line(line)
+        if record is not None:
+            self.writer.message_written(record)
+        self._buffered -= len(tasks)
+
+    async def _fetch(self, attachment, how):
+        """Download an attachment, shrinking it or making a thumbnail of it if asked to.
+        Returns (filename, data, how), or None if it couldn't be downloaded (or shrunk)"""
+        data = await self._download(attachment)
+        if data is None:
+            return None
+        filename = attachment.filename
+        if how == SHRINK:
+            shrunk = await self.transcoder.shrink(filename, data, archive_constants.TRANSCODE_TARGET)
+            if shrunk is None:
+                # Not an image Pillow can read after all, and too big to keep as it is
+                return None
+            filename, data = shrunk
+        elif how == THUMBNAIL:
+            thumbnail = await self.transcoder.thumbnail(filename, data)
+            if thumbnail is None:
+                return None
+            filename, data = thumbnail
+        return filename, data, how
+
+    async def _download(self, attachment):
+        """Download one attachment, retrying with exponential backoff. Returns None if it couldn't be downloaded"""
+        async with self._slots:
+            for attempt in range(self.retries + 1):
+                try:
+                    data = await attachment.read()
+                    if self.progress:
+                        self.progress.attachments += 1
+                    return data
+                except (nextcord.NotFound, nextcord.Forbidden):
+                    # Retrying won't help if the attachment is gone
+                    break
+                except (nextcord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.retries:
+                        print(f"Failed to download {attachment.filename} after {attempt + 1} attempts: {e}")
+                        break
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+        self.failed += 1
+        return None
@@ -0,0 +1,68 @@
+import json
+import os
+from datetime import datetime
+
+
+class CheckpointStore:
+    """Remembers how far each channel has been archived, so the next archive only needs the new messages
+
+    Checkpoints are kept in a json file keyed by channel id. Each one records the id of the last message that was
+    archived, and the attachment manifest (attachment id -> name it was stored under) so that later archives don't
+    reuse filenames from earlier ones."""
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoints = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.checkpoints = json.load(f)
+
+    def get(self, channel_id):
+        """Get the checkpoint for a channel, or None if it has never been archived"""
+        return self.checkpoints.get(str(channel_id))
+
+    def update(self, channel_id, last_message_id, attachments):
+        """Move a channel's checkpoint forward after its archive was sent"""
+        checkpoint = self.checkpoints.setdefault(str(channel_id), {'attachments': {}})
+        checkpoint['last_message_id'] = last_message_id
+        checkpoint['archived_at'] = datetime.utcnow().isoformat()
+        checkpoint['attachments'].update(attachments)
+        self.save()
+
+    def save(self):
+        write_json(self.path, self.checkpoints)
+
+
+class JobStore:
+    """Keeps every archive job that hasn't finished yet in a json file, so that jobs cut off by a restart can carry on
+    where they left off
+
+    Jobs are stored with ArchiveJob.to_dict(), keyed by job id, and saved again whenever a channel or a part of a
+    channel's archive has been sent."""
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.jobs = json.load(f)
+
+    def save(self, job):
+        self.jobs[str(job.id)] = job.to_dict()
+        write_json(self.path, self.jobs)
+
+    def remove(self, job_id):
+        if self.jobs.pop(str(job_id), None) is not None:
+            write_json(self.path, self.jobs)
+
+    def next_id(self):
+        """An id no stored job is using"""
+        return max(map(int, self.jobs), default=0) + 1
+
+
+def write_json(path, data):
+    # Write to a temporary file first so a crash can't leave a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -1,13 +1,24 @@
 import asyncio
 import os
-import zipfile
 
 import nextcord
 from nextcord.ext import commands
 from nextcord.ext.commands.core import has_permissions
+from modules.error_log.error_handler import ErrorHandler
 from utils import discord_utils, logging_utils
+import config
 
-from . import archive_constants, archive_utils
+from . import archive_constants, archive_utils, transcode
+from .archive_jobs import ArchiveJob, ArchiveQueue, PRIORITY_CATEGORY, PRIORITY_CHANNEL, PRIORITY_SERVER
+from .attachment_pool import AttachmentPool
+from .checkpoints import CheckpointStore, JobStore
+from .compression import POLICIES
+from .download_server import DownloadServer
+from .history_fetcher import HistoryFetcher
+from .message_record import MessageRecord
+from .search_index import SearchIndex
+from .split_writer import SplitArchiveWriter
+from .transcode import Transcoder
 
 
 # TODO: This cipher_race's gonna need some refactoring. We should be able to save a lot of space, since most of the commands
@@ -20,64 +31,132 @@ class ArchiveCog(commands.Cog, name="Archive"):
     """Downloads a channel's history and sends it as a file to the user"""
     def __init__(self, bot):
         self.bot = bot
-        self.compression = zipfile.ZIP_DEFLATED
-        self.lock = asyncio.Lock()
+        self.download_concurrency = archive_constants.DOWNLOAD_CONCURRENCY
+        # Each channel being archived takes a slot. Discord rate limits are per channel, so separate channels can
+        # be archived side by side, and nextcord waits out any rate limit we do hit
+        self.channel_slots = asyncio.Semaphore(archive_constants.CHANNEL_CONCURRENCY)
+        # Every history request takes one of these, however many channels (and slices of them) are being read
+        self.history_budget = asyncio.Semaphore(archive_constants.HISTORY_REQUESTS)
+        os.makedirs(config.STATE_DIR, exist_ok=True)
+        self.checkpoints = CheckpointStore(os.path.join(config.STATE_DIR, archive_constants.CHECKPOINTS_PATH))
+        # Jobs are saved as they go, and picked back up in on_ready if the bot restarted before they finished
+        self.job_store = JobStore(os.path.join(config.STATE_DIR, archive_constants.JOBS_PATH))
+        self.jobs = ArchiveQueue(self.run_job, first_id=self.job_store.next_id())
+        self.resumed = False
+        self.search_index = SearchIndex(os.path.join(config.STATE_DIR, archive_constants.SEARCH_INDEX_PATH))
+        self.transcoder = Transcoder()
+        # Only runs if it's been configured with a public url and a secret to sign links with
+        self.download_server = None
+        if config.ARCHIVE_DOWNLOAD_URL and config.ARCHIVE_DOWNLOAD_SECRET:
+            self.download_server = DownloadServer(config.ARCHIVE_DOWNLOAD_URL, config.ARCHIVE_DOWNLOAD_SECRET,
+                                                  config.ARCHIVE_DOWNLOAD_PORT,
+                                                  os.path.join(config.STATE_DIR, archive_constants.DOWNLOADS_PATH))
 
+        # Only clears out half-written zips. Jobs carry on from the last part they sent
         archive_utils.reset_archive_dir()
 
-    # TODO: While we're going through messages, it would be nice to see if we've already hit the 8MB limit somehow?
-    # That would speed up the archiving of categories and servers by a lot. I guess it would be hard since we aren't
-    # Compressing in real-time. We could try, though.
-    async def archive_one_channel(self, channel):
-        """Download a channel's history"""
-        # Write the chat log. Replace attachments with their filename (for easy reference)
-        text_log_path = os.path.join(archive_constants.ARCHIVE, channel.name + '_' + archive_constants.TEXT_LOG_PATH)
-        with open(text_log_path, 'w') as f:
-            async for msg in channel.history(limit=None, oldest_first=True):
-                #print(f"{msg.created_at} - {msg.author.display_name.rjust(25, ' ')}: {msg.clean_content}")
-                f.write(f"[ {msg.created_at.strftime('%m-%d-%Y, %H:%M:%S')} ] "
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Start the download server, and pick up the archive jobs that were cut off by a restart"""
+        if self.download_server is not None:
+            await self.download_server.start()
+        # on_ready fires again every time the bot reconnects
+        if self.resumed:
+            return
+        self.resumed = True
+        for data in list(self.job_store.jobs.values()):
+            # One job that can't be picked back up mustn't stop the rest from resuming
+            try:
+                job = ArchiveJob.from_dict(data, self.bot)
+            except Exception as error:
+                self.job_store.remove(data['id'])
+                await ErrorHandler("", error, f"Error while resuming archive job {data['id']}").handle_error()
+                continue
+            if job is None:
+                # Can't send the archives anywhere anymore
+                self.job_store.remove(data['id'])
+                continue
+            self.jobs.submit(job)
+            embed = discord_utils.create_embed()
+            embed.add_field(name="Archive Resumed",
+                            value=f"I restarted while archiving {job.target_name} (job {job.id}), so I'm picking up "
+                                  f"where I left off. {job.progress.channels_done} of {len(job.channels)} channels "
+                                  f"were already done.",
+                            inline=False)
+            try:
+                await job.destination.send(embed=embed)
+            except nextcord.HTTPException as error:
+                # The job is already queued, and is forgotten if it can't send anything once it runs
+                await ErrorHandler("", error, f"Error while resuming archive job {job.id}").handle_error()
+
+    async def archive_one_channel(self, channel, job_dir, filesize_limit, policy, progress, on_part, state,
+                                  split=True, export_format=None, index=False, shrink_images=False):
+        """Download a channel's history, streaming the chat log and attachments straight into the zip.
+        With split, the archive is cut into parts that each fit under filesize_limit and on_part is called to send
+        each one as soon as it is done. Otherwise, attachments that would push the zip over filesize_limit are linked
+        in the chat log instead. Without a filesize_limit, everything goes in one zip. Archiving starts from state
+        (see get_channel_state). With an export_format, a structured record of each message is exported alongside
+        the chat log. With index, the messages are added to the search index as well. With shrink_images, big
+        images are shrunk to fit"""
+        part_limit = filesize_limit - archive_constants.SPLIT_HEADROOM if split and filesize_limit else None
+        after = nextcord.Object(id=state['last_message_id']) if state['last_message_id'] else None
+        # Don't reuse any filename from the earlier archives (or parts)
+        writer = SplitArchiveWriter(job_dir, state['archive_name'], on_part, part_limit, policy,
+                                    state['attachments'].values(), state['parts'] + 1, export_format)
+        # Attachments are downloaded in the background while we keep reading the history
+        pool = AttachmentPool(writer, part_limit if split else filesize_limit, progress, split=split,
+                              transcoder=self.transcoder if shrink_images else None,
+                              concurrency=self.download_concurrency)
+        progress.channel_started(writer)
+        # Messages waiting to be added to the search index
+        batch = []
+        try:
+            # Write the chat log. Replace attachments with their filename (for easy reference)
+            async for msg in HistoryFetcher(channel, self.history_budget, after).messages():
+                line = (f"[ {msg.created_at.strftime('%m-%d-%Y, %H:%M:%S')} ] "
                         f"{msg.author.display_name.rjust(25, ' ')}: "
                         f"{msg.clean_content}")
-                # Save attachments TODO is this necessary? Might waste space
-                for attachment in msg.attachments:
-                    f.write(f" {attachment.filename}")
-                    # change duplicate filenames
-                    # img.png would become img (1).png
-                    original_path = os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES, attachment.filename)
-                    proposed_path = original_path
-                    dupe_counter = 1
-                    while os.path.exists(proposed_path):
-                        proposed_path = original_path.split('.')[0] + f" ({dupe_counter})." + original_path.split('.')[1]
-                        dupe_counter += 1
-                    await attachment.save(proposed_path)
-                # Important: Write the newline after each comment is done
-                f.write("\n")
-            text_file_size = f.tell()
-
-        ZIP_FILENAME = os.path.join(archive_constants.ARCHIVE, channel.name + '_archive.zip')
-        # Create a zipfile and then walk through all the saved chatlogs and images, and zip em up
-        with zipfile.ZipFile(ZIP_FILENAME, mode='w') as zf:
-            for root, directories, files in os.walk(archive_constants.ARCHIVE):
-                for filename in files:
-                    if filename == ZIP_FILENAME.split('/')[-1]: # Don't include self
-                        #TODO : It means that the first zipfile in the channel with the same name gets ignored. Minor big
-                        continue
-                    zf.write(os.path.join(root, filename), compress_type=self.compression)
-            zf_file_size = zf.fp.tell()
-        # TODO: It may often be the case that we will be above 8MB (max filesize).
-        # In that case, we just need to send the textfile
-        return nextcord.File(ZIP_FILENAME), zf_file_size, nextcord.File(text_log_path), text_file_size
-
-    def get_file_and_embed(self, channel, filesize_limit, zip_file, zip_file_size, textfile, textfile_size):
-        """Check if zipfile and textfile can be sent or not, create embed with message"""
+                # Only the record is kept once the line is queued, not the whole message
+                record = MessageRecord.from_message(msg)
+                if index:
+                    batch.append(record)
+                    if len(batch) >= archive_constants.INDEX_BATCH_SIZE:
+                        await self.search_index.add_messages(channel.guild.id, channel.id, channel.name, batch)
+                        batch = []
+                await pool.add_message(line, msg.attachments, record)
+                progress.messages += 1
+            if batch:
+                await self.search_index.add_messages(channel.guild.id, channel.id, channel.name, batch)
+            await pool.finish()
+            await writer.close()
+        finally:
+            pool.cancel()
+            await writer.abort()
+            progress.channel_finished(writer)
+        return writer
+
+    async def get_file_and_embed(self, channel, filesize_limit, writer):
+        """Check if zipfile and textfile can be sent or not, create embed with message.
+        Returns the file to attach, the embed, and whether the archive is getting to the user (as a file or a link)"""
         embed = discord_utils.create_embed()
-        if zip_file_size > filesize_limit:
-            if textfile_size > filesize_limit:
+        if writer.zip_size > filesize_limit and self.download_server is not None:
+            published = await self.download_server.publish(writer.zip_path)
+            if published is not None:
+                link, expires = published
+                embed.add_field(name="Archive Ready to Download",
+                                value=f"The archive of {channel.mention} is "
+                                      f"`{(writer.zip_size/self.BYTES_TO_MEGABYTES):.2f}MB`, too big to attach here, "
+                                      f"so you can [download it]({link}) instead. The link works until "
+                                      f"<t:{expires}:f>.",
+                                inline=False)
+                return None, embed, True
+        if writer.zip_size > filesize_limit:
+            if writer.text_log_size > filesize_limit:
                 embed.add_field(name="ERROR: History Too Big",
                                 value=f"Sorry about that! The chat log in {channel.mention} is too big for me to send.\n"
                                       f"The max file size I can send in this server is "
                                       f"`{(filesize_limit/self.BYTES_TO_MEGABYTES):.2f}MB`, but the chat log is "
-                                      f"`{(textfile_size/self.BYTES_TO_MEGABYTES):.2f}MB`",
+                                      f"`{(writer.text_log_size/self.BYTES_TO_MEGABYTES):.2f}MB`",
                                 inline=False)
                 file = None
             else:
@@ -85,16 +164,27 @@ class ArchiveCog(commands.Cog, name="Archive"):
                                 value=f"There are too many photos in {channel.mention} for me to send. The max file size "
                                       f"I can send in this server is "
                                       f"`{(filesize_limit/self.BYTES_TO_MEGABYTES):.2f}MB` but the zip is "
-                                      f"`{(zip_file_size/self.BYTES_TO_MEGABYTES):.2f}MB`. I'll only be able to send you the chat log.",
+                                      f"`{(writer.zip_size/self.BYTES_TO_MEGABYTES):.2f}MB`. I'll only be able to send you the chat log.",
                                 inline=False)
-                ZIP_FILENAME = os.path.join(archive_constants.ARCHIVE, channel.name + '_archive.zip')
-                with zipfile.ZipFile(ZIP_FILENAME, mode='w') as zf:
-                    zf.write(os.path.join(archive_constants.ARCHIVE, channel.name + '_' + archive_constants.TEXT_LOG_PATH), compress_type=self.compression)
-                file = zip_file
+                await writer.keep_only_text_log()
+                file = nextcord.File(writer.zip_path)
+        elif writer.linked:
+            embed.add_field(name="WARNING: Some Attachments Too Big",
+                            value=f"Not all of the attachments in {channel.mention} fit under the max file size I can "
+                                  f"send in this server (`{(filesize_limit/self.BYTES_TO_MEGABYTES):.2f}MB`). "
+                                  f"I've left links to the {writer.linked} that didn't fit in the chat log.",
+                            inline=False)
+            file = nextcord.File(writer.zip_path)
         else:
-            file = zip_file
-            embed = None
-        return file, embed
+            file = nextcord.File(writer.zip_path)
+        if file is not None:
+            ratio = writer.uncompressed_size / writer.zip_size if writer.zip_size else 1
+            embed.add_field(name="Compression",
+                            value=f"`{(writer.uncompressed_size/self.BYTES_TO_MEGABYTES):.2f}MB` compressed to "
+                                  f"`{(writer.zip_size/self.BYTES_TO_MEGABYTES):.2f}MB` ({ratio:.1f}x) in "
+                                  f"`{writer.compress_time:.2f}s` using the `{writer.policy.name}` policy",
+                            inline=False)
+        return file, embed, file is not None
 
     @commands.command(name="archive")
     @has_permissions(manage_messages=True)
@@ -109,219 +199,400 @@ class ArchiveCog(commands.Cog, name="Archive"):
     async def archivechannel(self, ctx, *args):
         """Command to download channel's history
 
-        Usage: `!archivechannel #channel`"""
-        # TODO: Need error handling for asking a channel we don't have access to or invalid channel name
+        Usage: `!archivechannel [--incremental] [--compression=fast|default|max|none] [--nosplit] [--export=jsonl|binary] [--index] [--transcode] [--download] #channel`"""
         logging_utils.log_command("archivechannel", ctx.channel, ctx.author)
+        try:
+            args, options = archive_utils.parse_archive_args(args)
+        except ValueError as e:
+            await ctx.send(embed=archive_utils.get_unknown_option_embed(e))
+            return
         # Check if the user supplied a channel
         if len(args) < 1:
             # No arguments provided
             await ctx.send(embed=discord_utils.create_no_argument_embed('channel'))
             return
-        # If we don't have the lock, let the user know it may take a while.
-        msg = None
-
+        channels = []
         for channelname in args:
-            if self.lock.locked():
-                msg = await ctx.send(embed=archive_utils.get_delay_embed())
-            # LOCK EVERYTHING
-            async with self.lock:
-                # If we printed a message about being delayed bc of lock, we can delete that now.
-                if msg:
-                    await msg.delete()
-                    msg = None
-                archive_utils.reset_archive_dir()
-                try:
-                    channel = discord_utils.find_channel(self.bot, ctx.guild.channels, channelname)
-                except ValueError:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: Cannot find channel",
-                                    value=f"Sorry, I cannot find a channel with name {channelname}",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    return
-                if not channel.type.name == 'text':
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: Cannot archive non-text channels",
-                                    value=f"Sorry! I can only archive text channels, but "
-                                          f"{channel} is a {channel.type} channel.",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    return
-                # If we've gotten to this point, we know we have a channel so we should probably let the user know.
-                start_embed = await self.get_start_embed(channel)
-                msg = await ctx.send(embed=start_embed)
-                try:
-                    # zipfile, textfile
-                    zip_file, zip_file_size, textfile, textfile_size = await self.archive_one_channel(channel)
-                except nextcord.errors.Forbidden:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: No access",
-                                    value=f"Sorry! I don't have access to {channel}. You'll need "
-                                           f"to give me permission to view the channel if you want "
-                                           f"to archive it",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    return
-                file, embed = self.get_file_and_embed(channel,
-                                                      ctx.guild.filesize_limit,
-                                                      zip_file,
-                                                      zip_file_size,
-                                                      textfile,
-                                                      textfile_size)
-                # There has been an issue with AIO HTTP message sending fails, in which case nextcord crashes?
-                # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
-                try:
-                    await ctx.send(file=file, embed=embed)
-                except RuntimeError:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: Failed to send archive",
-                                    value=f"Sorry! I had trouble sending you the archived file for "
-                                          f"{channel.mention}. Please try again later, and let kev know if this "
-                                          f"issue persists",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-
-                if msg:
-                    await msg.delete()
-                    msg = None
-            # Clean up the archive dir
-            archive_utils.reset_archive_dir()
+            try:
+                channel = discord_utils.find_channel(self.bot, ctx.guild.channels, channelname)
+            except ValueError:
+                channel = None
+            if channel is None:
+                embed = discord_utils.create_embed()
+                embed.add_field(name="ERROR: Cannot find channel",
+                                value=f"Sorry, I cannot find a channel with name {channelname}",
+                                inline=False)
+                await ctx.send(embed=embed)
+                return
+            if not channel.type.name == 'text':
+                embed = discord_utils.create_embed()
+                embed.add_field(name="ERROR: Cannot archive non-text channels",
+                                value=f"Sorry! I can only archive text channels, but "
+                                      f"{channel} is a {channel.type} channel.",
+                                inline=False)
+                await ctx.send(embed=embed)
+                return
+            channels.append(channel)
+        target = channels[0] if len(channels) == 1 else ", ".join(channel.mention for channel in channels)
+        await self.submit_job(ctx, ArchiveJob(ctx.channel, ctx.guild, ctx.author, target, channels, options,
+                                              PRIORITY_CHANNEL,
+                                              "Please try again later, and let kev know if this issue persists"))
 
     @commands.command(name="archivecategory")
     @has_permissions(manage_messages=True)
     async def archivecategory(self, ctx, *args):
         """Command to download the history of every text channel in the category
 
-        Usage: `!archivecategory category name`"""
+        Usage: `!archivecategory [--incremental] [--compression=fast|default|max|none] [--nosplit] [--export=jsonl|binary] [--index] [--transcode] [--download] category name`"""
         logging_utils.log_command("archivecategory", ctx.channel, ctx.author)
+        try:
+            args, options = archive_utils.parse_archive_args(args)
+        except ValueError as e:
+            await ctx.send(embed=archive_utils.get_unknown_option_embed(e))
+            return
         # Check if the user supplied a channel
         if len(args) < 1:
             # No arguments provided
             await ctx.send(embed=discord_utils.create_no_argument_embed('category'))
             return
-        # If we don't have the lock, let the user know it may take a while.
-        msg = None
-        if self.lock.locked():
-            msg = await ctx.send(embed=archive_utils.get_delay_embed())
-        # LOCK EVERYTHING
-        async with self.lock:
-            if msg:
-                await msg.delete()
-                msg = None
-            try:
-                category = discord_utils.find_channel(self.bot, ctx.guild.channels, ' '.join(args))
-            except ValueError:
-                embed = discord_utils.create_embed()
-                embed.add_field(name="ERROR: Cannot find category",
-                                value=f"Sorry, I cannot find a category with name {' '.join(args)}",
-                                inline=False)
-                await ctx.send(embed=embed)
-                return
-
-            start_embed = await self.get_start_embed(category, category.text_channels)
-            # SOMETIMES THE EMBED IS TOO LONG FOR DISCORD
-            embeds = discord_utils.split_embed(start_embed)
-            msgs = []
-            for embed in embeds:
-                msgs.append(await ctx.send(embed=embed))
-
-            for text_channel in category.text_channels:
-                archive_utils.reset_archive_dir()
-                try:
-                    zip_file, zip_file_size, textfile, textfile_size = await self.archive_one_channel(text_channel)
-                    file, embed = self.get_file_and_embed(text_channel,
-                                                          ctx.guild.filesize_limit,
-                                                          zip_file,
-                                                          zip_file_size,
-                                                          textfile,
-                                                          textfile_size)
-                    await ctx.send(file=file, embed=embed)
-                except nextcord.errors.Forbidden:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: No access",
-                                    value=f"Sorry! I don't have access to {text_channel.mention}. You'll need "
-                                          f"to give me permission to view the channel if you want "
-                                          f"to archive it",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    continue
-                # There has been an issue with AIO HTTP message sending fails, in which case nextcord crashes?
-                # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
-                except RuntimeError:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: Failed to send archive",
-                                    value=f"Sorry! I had trouble sending you the archived file for "
-                                          f"{text_channel.mention}. Perhaps you can try again with {ctx.prefix}archivechannel"
-                                          f" after I've finished archiving {category.mention}.",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    continue
-            if msgs:
-                for msg in msgs:
-                    await msg.delete()
+        try:
+            category = discord_utils.find_channel(self.bot, ctx.guild.channels, ' '.join(args))
+        except ValueError:
             embed = discord_utils.create_embed()
-            embed.add_field(name="All Done!",
-                            value=f"Successfully archived {category}",
+            embed.add_field(name="ERROR: Cannot find category",
+                            value=f"Sorry, I cannot find a category with name {' '.join(args)}",
                             inline=False)
             await ctx.send(embed=embed)
-        # Clean up the archive dir
-        archive_utils.reset_archive_dir()
+            return
+        retry_hint = (f"Perhaps you can try again with {ctx.prefix}archivechannel after I've finished archiving "
+                      f"{category.mention}.")
+        await self.submit_job(ctx, ArchiveJob(ctx.channel, ctx.guild, ctx.author, category, category.text_channels,
+                                              options, PRIORITY_CATEGORY, retry_hint))
 
-    # TODO: This cipher_race is mostly copy/pasted from archivecategory
     @commands.command(name="archiveserver")
     @has_permissions(administrator=True)
-    async def archiveserver(self, ctx):
+    async def archiveserver(self, ctx, *args):
         """Command to archive every text channel in the server. WARNING: This command will take *very* long on any reasonably aged server
 
-        Usage: `!archiveserver`"""
+        Usage: `!archiveserver [--incremental] [--compression=fast|default|max|none] [--nosplit] [--export=jsonl|binary] [--index] [--transcode] [--download]`"""
         logging_utils.log_command("archiveserver", ctx.channel, ctx.author)
-        # If we don't have the lock, let the user know it may take a while.
-        msg = None
-        if self.lock.locked():
-            msg = await ctx.send(embed=archive_utils.get_delay_embed())
-
-        # LOCK EVERYTHING
-        async with self.lock:
-            start_embed = await self.get_start_embed(ctx.guild, ctx.guild.text_channels)
-            if msg:
+        try:
+            _, options = archive_utils.parse_archive_args(args)
+        except ValueError as e:
+            await ctx.send(embed=archive_utils.get_unknown_option_embed(e))
+            return
+        retry_hint = (f"Perhaps you can try again with {ctx.prefix}archivechannel after I've finished archiving "
+                      f"{ctx.guild}.")
+        await self.submit_job(ctx, ArchiveJob(ctx.channel, ctx.guild, ctx.author, ctx.guild, ctx.guild.text_channels,
+                                              options, PRIORITY_SERVER, retry_hint))
+
+    @commands.command(name="archivestatus")
+    @has_permissions(manage_messages=True)
+    async def archivestatus(self, ctx):
+        """Command to show the archive jobs that are running or waiting to run
+
+        Usage: `!archivestatus`"""
+        logging_utils.log_command("archivestatus", ctx.channel, ctx.author)
+        embed = discord_utils.create_embed()
+        if not self.jobs.jobs:
+            embed.add_field(name="Archive Status",
+                            value="I'm not archiving anything right now!",
+                            inline=False)
+            await ctx.send(embed=embed)
+            return
+        # Running jobs first, then the queue in the order it will run
+        jobs = sorted(self.jobs.jobs.values(),
+                      key=lambda job: (job.status != ArchiveJob.RUNNING, job.priority, job.id))
+        # Embeds can only have 25 fields
+        for job in jobs[:25]:
+            if job.status == ArchiveJob.RUNNING:
+                value = self.get_progress_summary(job)
+            else:
+                value = (f"Number {self.jobs.position(job) + 1} in line, "
+                         f"{len(job.channels)} channel{'s' if len(job.channels) != 1 else ''}")
+            # Field names can only be 256 characters, too few for the mentions of a dozen or so channels
+            target = job.target_name
+            if len(target) > 100:
+                target = f"{len(job.channels)} channels"
+            embed.add_field(name=f"Job {job.id}: {target} ({job.status}, requested by {job.author})",
+                            value=value,
+                            inline=False)
+        embed.set_footer(text=f"Use {ctx.prefix}archivecancel <job> to cancel a job")
+        await ctx.send(embed=embed)
+
+    @commands.command(name="archivecancel")
+    @has_permissions(manage_messages=True)
+    async def archivecancel(self, ctx, job_id: int):
+        """Command to cancel an archive job, whether it's running or waiting to run
+
+        Usage: `!archivecancel <job>`"""
+        logging_utils.log_command("archivecancel", ctx.channel, ctx.author)
+        job = self.jobs.cancel(job_id)
+        embed = discord_utils.create_embed()
+        if job is None:
+            embed.add_field(name="ERROR: Cannot find job",
+                            value=f"Sorry, there's no archive job {job_id}. Use `{ctx.prefix}archivestatus` to see "
+                                  f"the jobs that are running or waiting to run.",
+                            inline=False)
+        else:
+            self.job_store.remove(job.id)
+            embed.add_field(name="Cancelling Archive",
+                            value=f"Cancelling job {job.id}, the archive of {job.target_name}.",
+                            inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="searcharchive")
+    @has_permissions(manage_messages=True)
+    async def searcharchive(self, ctx, *args):
+        """Command to search the messages of every channel archived with `--index`
+
+        Usage: `!searcharchive [--page=N] <query>`"""
+        logging_utils.log_command("searcharchive", ctx.channel, ctx.author)
+        try:
+            query, page = archive_utils.parse_search_args(args)
+        except ValueError as e:
+            embed = discord_utils.create_embed()
+            embed.add_field(name="ERROR: Invalid page",
+                            value=f"Sorry, `{e}` isn't a page I can show. Pages are numbered from 1.",
+                            inline=False)
+            await ctx.send(embed=embed)
+            return
+        if not query:
+            await ctx.send(embed=discord_utils.create_no_argument_embed('query'))
+            return
+        total, results, seconds = await self.search_index.search(ctx.guild.id, query, page,
+                                                                 archive_constants.SEARCH_PAGE_SIZE)
+        pages = max(-(-total // archive_constants.SEARCH_PAGE_SIZE), 1)
+        embed = discord_utils.create_embed()
+        if not results:
+            embed.add_field(name="No Results",
+                            value=f"I couldn't find `{query}` in any archived channel" +
+                                  (f" on page {page}. There are only {pages} pages of results." if total else
+                                   f". Only channels archived with `--index` can be searched."),
+                            inline=False)
+            await ctx.send(embed=embed)
+            return
+        embed.title = f"Results for {query}"
+        for result in results:
+            link = f"https://discord.com/channels/{ctx.guild.id}/{result.channel_id}/{result.message_id}"
+            embed.add_field(name=f"#{result.channel_name} | {result.author} | {result.created_at[:10]}",
+                            value=f"{result.snippet[:900]}\n[Jump to message]({link})",
+                            inline=False)
+        embed.set_footer(text=f"Page {page} of {pages} ({total} matches in {seconds * 1000:.0f}ms). "
+                              f"Use {ctx.prefix}searcharchive --page=<page> {query} to see more")
+        await ctx.send(embed=embed)
+
+    async def submit_job(self, ctx, job):
+        """Put a job in the queue, letting the user know if they have to wait for it"""
+        if job.options.transcode and not transcode.available():
+            embed = discord_utils.create_embed()
+            embed.add_field(name="ERROR: Can't shrink images",
+                            value="Sorry! `--transcode` needs Pillow, which isn't installed on this bot. "
+                                  "Try again without it.",
+                            inline=False)
+            await ctx.send(embed=embed)
+            return
+        if job.options.download and self.download_server is None:
+            embed = discord_utils.create_embed()
+            embed.add_field(name="ERROR: No download server",
+                            value="Sorry! `--download` needs the archive download server, which isn't set up on this "
+                                  "bot. Try again without it.",
+                            inline=False)
+            await ctx.send(embed=embed)
+            return
+        busy = self.jobs.is_busy()
+        position = self.jobs.submit(job)
+        self.job_store.save(job)
+        if busy or position:
+            job.delay_message = await ctx.send(embed=archive_utils.get_delay_embed(job.id, position, ctx.prefix))
+            # In case the job got going while we were sending that
+            if job.status != ArchiveJob.QUEUED:
+                await job.delay_message.delete()
+                job.delay_message = None
+
+    async def run_job(self, job):
+        """Run a job, forgetting it if it fails outside of any one channel (e.g. the bot can't send to its destination
+        anymore), since picking it back up after a restart would only fail the same way"""
+        try:
+            await self.archive_job(job)
+        except Exception:
+            self.job_store.remove(job.id)
+            raise
+
+    async def archive_job(self, job):
+        """Archive every channel in a job, several at a time, sending each archive as soon as it is done"""
+        if job.delay_message:
+            await job.delay_message.delete()
+            job.delay_message = None
+        job.progress.start()
+        start_embed = await self.get_start_embed(job.target, job.channels if job.priority != PRIORITY_CHANNEL else None)
+        # SOMETIMES THE EMBED IS TOO LONG FOR DISCORD
+        msgs = [await job.destination.send(embed=embed) for embed in discord_utils.split_embed(start_embed)]
+        msgs.append(await job.destination.send(embed=self.get_progress_embed(job)))
+        updater = asyncio.create_task(self.update_progress(job, msgs[-1]))
+
+        async def worker(text_channel):
+            if text_channel.id in job.done_channels:
+                # Sent before the bot restarted
+                return
+            async with self.channel_slots:
+                await self.archive_and_send(job, text_channel)
+                job.progress.channels_done += 1
+                job.done_channels.add(text_channel.id)
+                job.channel_states.pop(str(text_channel.id), None)
+                self.job_store.save(job)
+
+        try:
+            # Each channel waits for a free slot, so only CHANNEL_CONCURRENCY channels are archived at the same time
+            results = await asyncio.gather(*[worker(text_channel) for text_channel in job.channels],
+                                           return_exceptions=True)
+        except asyncio.CancelledError:
+            # Otherwise the bot is shutting down, and the job carries on once it's back
+            if job.status == ArchiveJob.CANCELLED:
+                embed = discord_utils.create_embed()
+                embed.add_field(name="Archive Cancelled",
+                                value=f"I've stopped archiving {job.target_name} after "
+                                      f"{job.progress.channels_done} of {len(job.channels)} channels.",
+                                inline=False)
+                await job.destination.send(embed=embed)
+            raise
+        finally:
+            updater.cancel()
+            for msg in msgs:
                 await msg.delete()
-                msg = None
-            # SOMETIMES THE EMBED IS TOO LONG FOR DISCORD
-            embeds = discord_utils.split_embed(start_embed)
-            msgs = []
-            for embed in embeds:
-                msgs.append(await ctx.send(embed=embed))
-
-            for text_channel in ctx.guild.text_channels:
-                archive_utils.reset_archive_dir()
-                try:
-                    zip_file, zip_file_size, textfile, textfile_size = await self.archive_one_channel(text_channel)
-                    file, embed = self.get_file_and_embed(text_channel,
-                                                          ctx.guild.filesize_limit,
-                                                          zip_file,
-                                                          zip_file_size,
-                                                          textfile,
-                                                          textfile_size)
-                    await ctx.send(file=file, embed=embed)
-                except nextcord.errors.Forbidden:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(name="ERROR: No access",
-                                    value=f"Sorry! I don't have access to {text_channel.mention}. You'll need "
-                                          f"to give me permission to view the channel if you want "
-                                          f"to archive it",
-                                    inline=False)
-                    await ctx.send(embed=embed)
-                    continue
-            if msgs:
-                for msg in msgs:
-                    await msg.delete()
+        self.job_store.remove(job.id)
+        if job.priority != PRIORITY_CHANNEL:
             embed = discord_utils.create_embed()
             embed.add_field(name="All Done!",
-                            value=f"Successfully archived {ctx.guild}",
+                            value=f"Successfully archived {job.target}",
                             inline=False)
-            await ctx.send(embed=embed)
-        # Clean up the archive dir
-        archive_utils.reset_archive_dir()
+            await job.destination.send(embed=embed)
+        # Let the error log know about anything unexpected
+        for result in results:
+            if isinstance(result, Exception):
+                try:
+                    raise result
+                except Exception as error:
+                    await ErrorHandler("", error, f"Error while running archive job {job.id}").handle_error()
+
+    async def update_progress(self, job, message):
+        """Edit the job's progress embed every so often, without going over Discord's edit rate limit"""
+        while True:
+            await asyncio.sleep(archive_constants.PROGRESS_INTERVAL)
+            try:
+                await message.edit(embed=self.get_progress_embed(job))
+            except nextcord.HTTPException:
+                pass
+
+    def get_progress_summary(self, job):
+        progress = job.progress
+        minutes, seconds = divmod(int(progress.elapsed), 60)
+        return (f"Channels: {progress.channels_done}/{progress.total_channels}\n"
+                f"Messages: {progress.messages} ({progress.messages_per_second:.1f}/sec)\n"
+                f"Attachments fetched: {progress.attachments}\n"
+                f"Written: `{(progress.bytes_written/self.BYTES_TO_MEGABYTES):.2f}MB`\n"
+                f"Elapsed: {minutes}:{seconds:02d}")
+
+    def get_progress_embed(self, job):
+        embed = discord_utils.create_embed()
+        embed.add_field(name=f"Archive Progress (job {job.id})",
+                        value=self.get_progress_summary(job),
+                        inline=False)
+        embed.set_footer(text=f"Use {self.bot.command_prefix}archivecancel {job.id} to cancel")
+        return embed
+
+    def get_channel_state(self, job, channel):
+        """Where to start archiving a channel from: the archive's name, the last message that's already been
+        archived, how many parts of this archive have been sent and the names their attachments were stored under"""
+        state = job.channel_states.get(str(channel.id))
+        if state is not None:
+            # The job was cut off partway through this channel, carry on after the last part that was sent
+            return state
+        checkpoint = self.checkpoints.get(channel.id) if job.options.incremental else None
+        if checkpoint:
+            # Name the zip after the checkpoint
+            since = nextcord.utils.snowflake_time(checkpoint['last_message_id']).strftime('%Y-%m-%d')
+            return {'archive_name': f"{channel.name}_since_{since}", 'last_message_id': checkpoint['last_message_id'],
+                    'parts': 0, 'attachments': dict(checkpoint['attachments']), 'incremental': True}
+        return {'archive_name': channel.name, 'last_message_id': None, 'parts': 0, 'attachments': {},
+                'incremental': False}
+
+    async def archive_and_send(self, job, channel):
+        """Archive a channel in its own working directory, sending each part of the archive as soon as it's done"""
+        state = self.get_channel_state(job, channel)
+        resumed = state['parts'] > 0
+        job_dir = archive_utils.make_job_dir()
+        # Once a part fails to send, the checkpoint must stay before it so the next incremental archive retries it
+        send_failed = False
+
+        async def send_part(part, number, final):
+            nonlocal send_failed
+            try:
+                if final and part.last_message_id is None and (number > 1 or state['incremental']):
+                    # Nothing left to send. If nothing was sent at all, we let the user know below
+                    return
+                file, embed, delivered = await self.get_file_and_embed(channel, job.guild.filesize_limit, part)
+                if number > 1 or not final:
+                    embed.add_field(name=f"Part {number}{' (last part)' if final else ''}",
+                                    value=f"Messages in {channel.mention} from "
+                                          f"{part.first_message_at.strftime('%m-%d-%Y, %H:%M:%S')} to "
+                                          f"{part.last_message_at.strftime('%m-%d-%Y, %H:%M:%S')}",
+                                    inline=False)
+                # There has been an issue with AIO HTTP message sending fails, in which case nextcord crashes?
+                # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
+                try:
+                    await job.destination.send(file=file, embed=embed)
+                    # Remember where this part ended so the next incremental archive can pick up from there
+                    if delivered and part.last_message_id is not None and not send_failed:
+                        self.checkpoints.update(channel.id, part.last_message_id, part.attachments)
+                except RuntimeError:
+                    send_failed = True
+                    embed = discord_utils.create_embed()
+                    embed.add_field(name="ERROR: Failed to send archive",
+                                    value=f"Sorry! I had trouble sending you the archived file for "
+                                          f"{channel.mention}{f' (part {number})' if number > 1 or not final else ''}. "
+                                          f"{job.retry_hint}",
+                                    inline=False)
+                    await job.destination.send(embed=embed)
+                if not final and part.last_message_id is not None:
+                    # If the bot restarts, the job carries on from the next part
+                    state['last_message_id'] = part.last_message_id
+                    state['parts'] = number
+                    state['attachments'].update(part.attachments)
+                    job.channel_states[str(channel.id)] = state
+                    self.job_store.save(job)
+            finally:
+                # Only keep one part at a time on disk
+                part.remove_files()
+
+        try:
+            try:
+                # With --download nothing is held back to fit the upload limit, too big archives get a link instead
+                writer = await self.archive_one_channel(channel, job_dir,
+                                                        None if job.options.download else job.guild.filesize_limit,
+                                                        POLICIES[job.options.compression], job.progress, send_part,
+                                                        state, job.options.split and not job.options.download,
+                                                        job.options.export,
+                                                        job.options.index, job.options.transcode)
+            except nextcord.errors.Forbidden:
+                embed = discord_utils.create_embed()
+                embed.add_field(name="ERROR: No access",
+                                value=f"Sorry! I don't have access to {channel.mention}. You'll need "
+                                      f"to give me permission to view the channel if you want "
+                                      f"to archive it",
+                                inline=False)
+                await job.destination.send(embed=embed)
+                return
+            if writer.last_message_id is None and state['incremental'] and not resumed:
+                embed = discord_utils.create_embed()
+                embed.add_field(name="Nothing New",
+                                value=f"There haven't been any new messages in {channel.mention} since it was last "
+                                      f"archived.",
+                                inline=False)
+                await job.destination.send(embed=embed)
+        finally:
+            # Clean up this channel's working directory
+            archive_utils.remove_job_dir(job_dir)
 
     async def get_start_embed(self, channel_or_guild, multiple_channels=None):
         embed = discord_utils.create_embed()
@@ -0,0 +1,47 @@
+import os
+import zipfile
+
+
+# Formats that are already compressed. Deflating them again costs CPU and saves next to nothing
+PRECOMPRESSED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.heic',
+    '.mp4', '.mov', '.webm', '.mkv', '.mp3', '.ogg', '.m4a', '.flac',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.rar',
+}
+
+
+class CompressionPolicy:
+    """Decides how each file in an archive gets compressed
+
+    Each setting is a (compress_type, compresslevel) pair as understood by zipfile. Attachments that are already
+    compressed (images, video, audio, archives) are always stored as-is."""
+
+    def __init__(self, name, attachments, text_log, precompressed=(zipfile.ZIP_STORED, None)):
+        self.name = name
+        self.attachments = attachments
+        self.text_log = text_log
+        self.precompressed = precompressed
+
+    def for_attachment(self, filename):
+        """How to compress an attachment with the given filename"""
+        if os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+            return self.precompressed
+        return self.attachments
+
+    def for_text_log(self):
+        """How to compress the chat log"""
+        return self.text_log
+
+
+POLICIES = {
+    policy.name: policy for policy in (
+        # Quickest, for when the archive is needed right away
+        CompressionPolicy('fast', (zipfile.ZIP_DEFLATED, 1), (zipfile.ZIP_DEFLATED, 1)),
+        # Chat logs compress very well, so they get the most effort
+        CompressionPolicy('default', (zipfile.ZIP_DEFLATED, 6), (zipfile.ZIP_DEFLATED, 9)),
+        # Smallest archive, for channels that only barely go over the size limit
+        CompressionPolicy('max', (zipfile.ZIP_LZMA, None), (zipfile.ZIP_LZMA, None)),
+        # Don't compress anything
+        CompressionPolicy('none', (zipfile.ZIP_STORED, None), (zipfile.ZIP_STORED, None)),
+    )
+}
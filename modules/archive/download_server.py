@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import shutil
+import time
+from urllib.parse import quote
+
+from aiohttp import web
+
+from . import archive_constants
+
+
+class DownloadServer:
+    """Serves archives that are too big to attach to a Discord message, behind expiring signed links
+
+    Published archives are moved into their own directory under an unguessable name. A link is only good until the
+    time in it, and is signed with an HMAC of the name and that time, so links can't be made up or extended. Files
+    are sent with aiohttp's FileResponse, which uses sendfile and handles range requests, so downloads are
+    zero-copy and can be resumed.
+
+    Archives are deleted once they're older than retention seconds, and the oldest ones are deleted early whenever
+    the directory would go over quota bytes."""
+
+    def __init__(self, base_url, secret, port,
+                 directory=archive_constants.DOWNLOADS_PATH,
+                 link_ttl=archive_constants.DOWNLOAD_LINK_TTL,
+                 retention=archive_constants.DOWNLOAD_RETENTION,
+                 quota=archive_constants.DOWNLOAD_QUOTA):
+        self.base_url = base_url.rstrip('/')
+        self.secret = secret.encode('utf-8')
+        self.port = port
+        self.directory = directory
+        self.link_ttl = link_ttl
+        self.retention = retention
+        self.quota = quota
+        self._runner = None
+        self._cleanup_task = None
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app = web.Application()
+        app.router.add_get('/archives/{name}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        self._cleanup_task = asyncio.create_task(self._clean_up_regularly())
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        self._cleanup_task.cancel()
+        await self._runner.cleanup()
+        self._runner = None
+
+    def _sign(self, name, expires):
+        return hmac.new(self.secret, f"{name}:{expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    async def handle(self, request):
+        name = request.match_info['name']
+        expires = request.query.get('expires', '')
+        signature = request.query.get('sig', '')
+        if not expires.isdigit() or not hmac.compare_digest(self._sign(name, expires), signature):
+            raise web.HTTPForbidden(text="Invalid link")
+        if int(expires) < time.time():
+            raise web.HTTPGone(text="This link has expired")
+        path = os.path.join(self.directory, name)
+        # The signature covers the name, but don't let anything outside the directory be served regardless
+        if os.path.basename(name) != name or not os.path.isfile(path):
+            raise web.HTTPNotFound(text="This archive has been deleted")
+        filename = name.split('_', 1)[1]
+        return web.FileResponse(path, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    async def publish(self, path):
+        """Move a finished archive into the download directory. Returns (link, time it expires), or None if it's
+        bigger than the whole quota"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._publish, path)
+
+    def _publish(self, path):
+        size = os.path.getsize(path)
+        if size > self.quota:
+            return None
+        self._evict(self.quota - size)
+        name = f"{secrets.token_hex(8)}_{os.path.basename(path)}"
+        shutil.move(path, os.path.join(self.directory, name))
+        expires = int(time.time() + self.link_ttl)
+        link = f"{self.base_url}/archives/{quote(name)}?expires={expires}&sig={self._sign(name, expires)}"
+        return link, expires
+
+    def _archives(self):
+        """(modified time, size, path) of every archive in the directory, oldest first"""
+        archives = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                archives.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(archives)
+
+    def _evict(self, max_size):
+        """Delete archives that are past retention, then the oldest ones until at most max_size bytes are left"""
+        archives = self._archives()
+        total = sum(size for _, size, _ in archives)
+        cutoff = time.time() - self.retention
+        for modified, size, path in archives:
+            if modified >= cutoff and total <= max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    async def _clean_up_regularly(self):
+        while True:
+            await asyncio.get_running_loop().run_in_executor(None, self._evict, self.quota)
+            await asyncio.sleep(archive_constants.DOWNLOAD_CLEANUP_INTERVAL)
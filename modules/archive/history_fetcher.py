@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timezone
+
+import nextcord
+
+from . import archive_constants
+
+# Most messages Discord returns for one history request
+PAGE_SIZE = 100
+
+
+class HistoryFetcher:
+    """Reads a channel's history oldest first, fetching several stretches of it at the same time
+
+    channel.history() asks for one page of 100 messages after another, so a channel with 100k messages is a chain
+    of 1000 requests that each wait for the one before. Message ids are snowflakes, which go up with the time the
+    message was sent, so the channel's lifetime can be cut into slices by id and each slice read with its own
+    after/before bounds. A few slices are read at the same time (the slices after the one being read fill up a
+    bounded buffer), and messages are handed out slice by slice, so they still come out in order.
+
+    Every history request takes a slot from budget, a semaphore shared by everything reading history, so archiving
+    several channels at once doesn't hammer the API. nextcord still waits out any rate limit we do hit.
+
+    The first page is always fetched on its own, so a channel with fewer than 100 messages costs one request,
+    the same as before, and how long that page took to fill decides how many slices the rest is cut into."""
+
+    def __init__(self, channel, budget, after=None,
+                 slices=archive_constants.HISTORY_SLICES,
+                 concurrency=archive_constants.HISTORY_CONCURRENCY,
+                 buffer=archive_constants.HISTORY_BUFFER):
+        self.channel = channel
+        self.budget = budget
+        self.after = after
+        self.slices = slices
+        self.concurrency = concurrency
+        self.buffer = buffer
+        # Number of history requests made, for the benchmarks
+        self.requests = 0
+
+    async def _fetch_page(self, after, before=None):
+        """The (up to) 100 oldest messages after after and before before"""
+        async with self.budget:
+            self.requests += 1
+            return [msg async for msg in self.channel.history(limit=PAGE_SIZE, after=after, before=before,
+                                                              oldest_first=True)]
+
+    async def _fetch_slice(self, start, end, queue):
+        """Put every message with start < id <= end in the queue, followed by None"""
+        after = nextcord.Object(id=start)
+        before = nextcord.Object(id=end + 1)
+        try:
+            while True:
+                page = await self._fetch_page(after, before)
+                for msg in page:
+                    await queue.put(msg)
+                # A short page means we've hit the end of the slice
+                if len(page) < PAGE_SIZE:
+                    break
+                after = page[-1]
+        except Exception:
+            # Wake up the reader, who then gets the error from the task
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def messages(self):
+        """Yield every message in the channel (after self.after, if given), oldest first"""
+        first_page = await self._fetch_page(self.after or nextcord.Object(id=0))
+        for msg in first_page:
+            yield msg
+        if len(first_page) < PAGE_SIZE:
+            return
+        # Split whatever is left, up to now, into slices of equal time
+        start = first_page[-1].id
+        end = max(nextcord.utils.time_snowflake(datetime.now(timezone.utc), high=True),
+                  self.channel.last_message_id or 0, start + 1)
+        # Guess how many pages are left from how long it took to send the first 100 messages, so a channel that's
+        # only a little over a page isn't cut into lots of slices that each cost a request to find empty
+        first_page_time = max(first_page[-1].id - first_page[0].id, 1)
+        slices = min(max((end - start) // first_page_time, 1), self.slices)
+        step = max((end - start) // slices, 1)
+        bounds = list(range(start, end, step))[:slices] + [end]
+        slices = list(zip(bounds, bounds[1:]))
+
+        queues = []
+        tasks = []
+
+        def start_next_slice():
+            if len(tasks) < len(slices):
+                queue = asyncio.Queue(maxsize=self.buffer)
+                queues.append(queue)
+                tasks.append(asyncio.create_task(self._fetch_slice(*slices[len(tasks)], queue)))
+
+        try:
+            for _ in range(self.concurrency):
+                start_next_slice()
+            for i in range(len(slices)):
+                queue = queues[i]
+                while (msg := await queue.get()) is not None:
+                    yield msg
+                # Surface any error from the slice we just finished
+                await tasks[i]
+                start_next_slice()
+        finally:
+            for task in tasks:
+                task.cancel()
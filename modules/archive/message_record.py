@@ -0,0 +1,132 @@
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+
+class MessageRecord:
+    """The parts of a message that go into a structured archive export
+
+    Records are made as soon as a message comes out of the history, so the archiver doesn't keep nextcord.Message
+    objects (and everything they point to) around while attachments download. A channel can have hundreds of
+    thousands of messages, so records use __slots__ and only hold plain values."""
+
+    __slots__ = ('id', 'channel_id', 'author_id', 'author', 'created_at', 'edited_at', 'content', 'reply_to',
+                 'attachments', 'reactions', 'embeds')
+
+    def __init__(self, id, channel_id, author_id, author, created_at, edited_at=None, content='', reply_to=None,
+                 attachments=(), reactions=(), embeds=()):
+        self.id = id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.author = author
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.content = content
+        # Id of the message this one replies to
+        self.reply_to = reply_to
+        # Name each attachment was stored under in the zip, or its url if it wasn't downloaded
+        self.attachments = list(attachments)
+        # [emoji, count] for each reaction
+        self.reactions = list(reactions)
+        # Embeds as Discord's json
+        self.embeds = list(embeds)
+
+    @classmethod
+    def from_message(cls, msg):
+        """Record a nextcord.Message. Attachment names are filled in once the attachments have been stored"""
+        return cls(msg.id, msg.channel.id, msg.author.id, msg.author.display_name, msg.created_at, msg.edited_at,
+                   msg.content, msg.reference.message_id if msg.reference else None,
+                   reactions=[[str(reaction.emoji), reaction.count] for reaction in msg.reactions],
+                   embeds=[embed.to_dict() for embed in msg.embeds])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'channel_id': self.channel_id,
+            'author_id': self.author_id,
+            'author': self.author,
+            'created_at': self.created_at.isoformat(),
+            'edited_at': self.edited_at.isoformat() if self.edited_at else None,
+            'content': self.content,
+            'reply_to': self.reply_to,
+            'attachments': self.attachments,
+            'reactions': self.reactions,
+            'embeds': self.embeds,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['channel_id'], data['author_id'], data['author'],
+                   datetime.fromisoformat(data['created_at']),
+                   datetime.fromisoformat(data['edited_at']) if data['edited_at'] else None,
+                   data['content'], data['reply_to'], data['attachments'], data['reactions'], data['embeds'])
+
+    def to_jsonl(self):
+        return (json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def to_binary(self):
+        """Length-prefixed record: the ids and times packed as integers, then the author, the content and
+        everything else (as compact json) as length-prefixed utf-8. Times are microseconds since the epoch, and 0
+        stands for no edit and no reply"""
+        extra = {key: value for key, value in (('attachments', self.attachments), ('reactions', self.reactions),
+                                               ('embeds', self.embeds)) if value}
+        strings = [self.author, self.content, json.dumps(extra, separators=(',', ':')) if extra else '']
+        payload = _HEADER.pack(self.id, self.channel_id, self.author_id, _to_micros(self.created_at),
+                               _to_micros(self.edited_at), self.reply_to or 0)
+        for string in strings:
+            data = string.encode('utf-8')
+            payload += _LENGTH.pack(len(data)) + data
+        return _LENGTH.pack(len(payload)) + payload
+
+    @classmethod
+    def from_binary(cls, payload):
+        """Read a record written by to_binary, without its length prefix"""
+        id, channel_id, author_id, created_at, edited_at, reply_to = _HEADER.unpack_from(payload)
+        offset = _HEADER.size
+        strings = []
+        for _ in range(3):
+            length, = _LENGTH.unpack_from(payload, offset)
+            offset += _LENGTH.size
+            strings.append(payload[offset:offset + length].decode('utf-8'))
+            offset += length
+        author, content, extra = strings
+        extra = json.loads(extra) if extra else {}
+        return cls(id, channel_id, author_id, author, _from_micros(created_at), _from_micros(edited_at),
+                   content, reply_to or None, extra.get('attachments', ()), extra.get('reactions', ()),
+                   extra.get('embeds', ()))
+
+
+_HEADER = struct.Struct('<QQQqqQ')
+_LENGTH = struct.Struct('<I')
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(time):
+    if time is None:
+        return 0
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return (time - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros):
+    return _EPOCH + micros * _MICROSECOND if micros else None
+
+
+# Export format name -> (file extension, how to encode a record)
+EXPORT_FORMATS = {
+    'jsonl': ('jsonl', MessageRecord.to_jsonl),
+    'binary': ('bin', MessageRecord.to_binary),
+}
+
+
+def read_records(f, export_format):
+    """Yield the MessageRecords in an export file opened in binary mode"""
+    if export_format == 'jsonl':
+        for line in f:
+            yield MessageRecord.from_dict(json.loads(line))
+    else:
+        while header := f.read(_LENGTH.size):
+            length, = _LENGTH.unpack(header)
+            yield MessageRecord.from_binary(f.read(length))
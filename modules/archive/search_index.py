@@ -0,0 +1,82 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SearchResult:
+    """One message that matched a search, with the matching words in its snippet marked in bold"""
+
+    __slots__ = ('message_id', 'channel_id', 'channel_name', 'author', 'created_at', 'snippet')
+
+    def __init__(self, message_id, channel_id, channel_name, author, created_at, snippet):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.author = author
+        self.created_at = created_at
+        self.snippet = snippet
+
+
+class SearchIndex:
+    """A full-text index of archived messages, in an SQLite FTS5 table
+
+    Every message is stored once under its message id, so archiving a channel again (or incrementally) just adds the
+    new messages. Searches are limited to one guild at a time and sorted by relevance. Everything runs on a thread of
+    the index's own, so neither indexing a big channel nor a search blocks the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._db = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self):
+        # Opened on first use, from the index's own thread
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                             "content, author, channel_name, "
+                             "guild_id UNINDEXED, channel_id UNINDEXED, created_at UNINDEXED)")
+        return self._db
+
+    async def add_messages(self, guild_id, channel_id, channel_name, records):
+        """Index a batch of MessageRecords from one channel"""
+        rows = [(record.id, record.content, record.author, channel_name, guild_id, channel_id,
+                 record.created_at.isoformat()) for record in records]
+        await self._run(self._add_messages, rows)
+
+    def _add_messages(self, rows):
+        db = self._connect()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO messages"
+                           "(rowid, content, author, channel_name, guild_id, channel_id, created_at) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    async def search(self, guild_id, query, page=1, page_size=10):
+        """Find the messages in a guild matching query. Returns (number of matches, one page of SearchResults,
+        seconds the search took)"""
+        return await self._run(self._search, guild_id, query, page, page_size)
+
+    def _search(self, guild_id, query, page, page_size):
+        start = time.perf_counter()
+        db = self._connect()
+        try:
+            total, results = self._query(db, guild_id, query, page, page_size)
+        except sqlite3.OperationalError:
+            # Not valid FTS5 query syntax (a stray quote, say), so look for the words as they are
+            query = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            total, results = self._query(db, guild_id, query, page, page_size)
+        return total, results, time.perf_counter() - start
+
+    def _query(self, db, guild_id, query, page, page_size):
+        total, = db.execute("SELECT COUNT(*) FROM messages WHERE messages MATCH ? AND guild_id = ?",
+                            (query, guild_id)).fetchone()
+        rows = db.execute("SELECT rowid, channel_id, channel_name, author, created_at, "
+                          "snippet(messages, 0, '**', '**', '...', 24) "
+                          "FROM messages WHERE messages MATCH ? AND guild_id = ? "
+                          "ORDER BY rank LIMIT ? OFFSET ?",
+                          (query, guild_id, page_size, (page - 1) * page_size)).fetchall()
+        return total, [SearchResult(*row) for row in rows]
@@ -0,0 +1,123 @@
+import asyncio
+
+from . import archive_constants
+from .archive_writer import ArchiveWriter
+from .compression import POLICIES
+
+
+class SplitArchiveWriter:
+    """Writes a channel's archive as a series of zips (parts) that each fit under a size limit
+
+    Everything goes into the current part until the next attachment or chat log line would push it over part_limit.
+    That part is then closed and handed to on_part(part, number, final) to be uploaded in the background, and a new
+    part is started, so the first part of a big channel is sent long before the rest of the history has been read.
+    Parts are uploaded one at a time and in order, and only one finished part waits on disk while the next one is
+    written. Each part has the chat log for its own stretch of time, and attachment names are unique across all the
+    parts, so a name in any chat log can be found in exactly one of them.
+
+    Without a part_limit everything goes into a single part. An archive that was cut off partway through (by a
+    restart) is carried on by starting from first_part."""
+
+    def __init__(self, directory, archive_name, on_part, part_limit=None,
+                 policy=POLICIES[archive_constants.DEFAULT_COMPRESSION], filenames=(), first_part=1, export_format=None):
+        self.directory = directory
+        self.archive_name = archive_name
+        self.on_part = on_part
+        self.part_limit = part_limit
+        self.policy = policy
+        self.first_part = first_part
+        self.export_format = export_format
+        # Every part so far, the last one being the one that is written to
+        self.parts = [ArchiveWriter(directory, self._part_name(first_part), policy, filenames,
+                                    export_format=export_format)]
+        # Upload of the most recently finished part
+        self._upload = None
+        self._closed = False
+
+    @property
+    def current(self):
+        return self.parts[-1]
+
+    @property
+    def number(self):
+        """Part number of the current part"""
+        return self.first_part + len(self.parts) - 1
+
+    def _part_name(self, number):
+        # The first part only gets a part number once we know there's going to be a second
+        return self.archive_name if number == 1 else f"{self.archive_name}_part{number}"
+
+    @property
+    def linked(self):
+        return self.current.linked
+
+    @linked.setter
+    def linked(self, linked):
+        # Counted per part, so each part's message can say how many of its attachments are links
+        self.current.linked = linked
+
+    @property
+    def last_message_id(self):
+        return next((part.last_message_id for part in reversed(self.parts) if part.last_message_id is not None), None)
+
+    @property
+    def attachments(self):
+        manifest = {}
+        for part in self.parts:
+            manifest.update(part.attachments)
+        return manifest
+
+    @property
+    def zip_size(self):
+        return sum(part.zip_size for part in self.parts)
+
+    @property
+    def bytes_written(self):
+        return sum(part.bytes_written for part in self.parts)
+
+    def projected_size(self):
+        return self.current.projected_size()
+
+    def message_written(self, message):
+        self.current.message_written(message)
+
+    async def make_room(self, size):
+        """Start a new part if about size more bytes wouldn't fit in the current one"""
+        if (self.part_limit is not None and not self.current.is_empty()
+                and self.current.projected_size() + size > self.part_limit):
+            await self._finish_part(final=False)
+            self.parts.append(ArchiveWriter(self.directory, self._part_name(self.number + 1), self.policy,
+                                            previous=self.current, export_format=self.export_format))
+
+    async def write_line(self, line):
+        await self.make_room(len(line.encode('utf-8')) + 1)
+        await self.current.write_line(line)
+
+    async def add_attachment(self, filename, data, attachment_id=None):
+        await self.make_room(len(data) + archive_constants.ZIP_ENTRY_OVERHEAD)
+        return await self.current.add_attachment(filename, data, attachment_id)
+
+    async def _finish_part(self, final):
+        part = self.current
+        number = self.number
+        await part.close(f"{self.archive_name}_part1" if number == 1 and not final else None)
+        if self._upload is not None:
+            await self._upload
+        self._upload = asyncio.create_task(self.on_part(part, number, final))
+
+    async def close(self):
+        """Close the last part, and wait until every part has been uploaded"""
+        if self._closed:
+            return
+        self._closed = True
+        await self._finish_part(final=True)
+        await self._upload
+
+    async def abort(self):
+        """Close the current part without uploading it, and stop any upload in progress"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._upload is not None:
+            self._upload.cancel()
+        await self.current.close()
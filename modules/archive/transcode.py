@@ -0,0 +1,104 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import archive_constants
+
+# Pillow is optional. Without it, archives keep every image as it was sent
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Still images Pillow can shrink. Animated gifs are left alone, since they'd lose their animation
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff'}
+
+# (longest side in pixels, JPEG quality) to try in turn until an image is small enough
+SHRINK_STEPS = ((4096, 85), (2560, 80), (1920, 75), (1280, 70), (960, 65), (640, 60), (320, 50))
+
+
+def available():
+    return Image is not None
+
+
+def is_image(filename):
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _load(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ('RGB', 'L'):
+        # JPEG has no transparency, so put transparent images on a white background
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    return image
+
+
+def _save(image, quality):
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def shrink_image(data, target_size):
+    """Downscale and recompress an image as a JPEG, a step at a time, until it's at most target_size bytes.
+    Returns the smallest version made if none of the steps get there, or None if Pillow can't read the image.
+    Runs in a worker process"""
+    try:
+        image = _load(data)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    smallest = None
+    for max_dimension, quality in SHRINK_STEPS:
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension))
+        shrunk = _save(image, quality)
+        if smallest is None or len(shrunk) < len(smallest):
+            smallest = shrunk
+        if len(shrunk) <= target_size:
+            break
+    return smallest
+
+
+def make_thumbnail(data, size):
+    """A small JPEG preview of an image, at most size pixels on its longest side. Runs in a worker process"""
+    try:
+        image = _load(data)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    image.thumbnail((size, size))
+    return _save(image, 60)
+
+
+class Transcoder:
+    """Shrinks images so more of them fit in an archive, using a pool of worker processes
+
+    Decoding and re-encoding images is CPU heavy and holds the GIL, so it runs in other processes rather than on
+    the event loop or the archive writers' threads. The pool is only started the first time it's needed."""
+
+    def __init__(self, processes=archive_constants.TRANSCODE_PROCESSES):
+        self.processes = processes
+        self._executor = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def shrink(self, filename, data, target_size):
+        """Returns the new (filename, data), or None if the image couldn't be made any smaller"""
+        shrunk = await self._run(shrink_image, data, target_size)
+        if shrunk is None or len(shrunk) >= len(data):
+            return None
+        return os.path.splitext(filename)[0] + '.jpg', shrunk
+
+    async def thumbnail(self, filename, data):
+        """Returns (filename, data) of a thumbnail of the image, or None if it couldn't be read"""
+        thumbnail = await self._run(make_thumbnail, data, archive_constants.THUMBNAIL_SIZE)
+        if thumbnail is None:
+            return None
+        return 'thumbnail_' + os.path.splitext(filename)[0] + '.jpg', thumbnail
@@ -0,0 +1,56 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+# (title, description, url) of an announcement
+Rendered = Tuple[str, str, str]
+
+
+class AnnouncementCache:
+	"""Remembers what was announced for each submission, and where
+
+	Rendered announcements are kept in a bounded LRU by submission id, along with the post's `edited` time, so that
+	resending or refreshing an announcement for a post that hasn't changed needs neither Reddit nor the formatters.
+	The id of the message each submission was announced in is kept in an SQLite table, so announcements can still be
+	edited after a restart."""
+
+	def __init__(self, path, size=100):
+		self.size = size
+		# submission id -> (edited time or False, channel id, rendered announcement), most recently used last
+		self._rendered = OrderedDict()
+		self._db = sqlite3.connect(path)
+		self._db.execute(
+			"CREATE TABLE IF NOT EXISTS announcements "
+			"(id TEXT PRIMARY KEY, channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL)"
+		)
+
+	def get(self, submission_id: str, edited: Union[float, bool, None] = None) -> Optional[Tuple[int, Rendered]]:
+		"""(channel id, rendered announcement) for a submission, or None if it isn't cached.
+		If `edited` is given, the cached announcement must have been rendered from that version of the post"""
+		entry = self._rendered.get(submission_id)
+		if entry is None or (edited is not None and entry[0] != edited):
+			return None
+		self._rendered.move_to_end(submission_id)
+		return entry[1], entry[2]
+
+	def put(self, submission_id: str, edited: Union[float, bool], channel_id: int, rendered: Rendered):
+		self._rendered[submission_id] = (edited, channel_id, rendered)
+		self._rendered.move_to_end(submission_id)
+		if len(self._rendered) > self.size:
+			self._rendered.popitem(last=False)
+
+	def get_message(self, submission_id: str) -> Optional[Tuple[int, int]]:
+		"""(channel id, message id) of the announcement for a submission, or None if it hasn't been announced"""
+		return self._db.execute(
+			"SELECT channel_id, message_id FROM announcements WHERE id = ?", (submission_id,)
+		).fetchone()
+
+	def set_message(self, submission_id: str, channel_id: int, message_id: int):
+		with self._db:
+			self._db.execute(
+				"INSERT OR REPLACE INTO announcements (id, channel_id, message_id) VALUES (?, ?, ?)",
+				(submission_id, channel_id, message_id),
+			)
+
+	def close(self):
+		self._db.close()
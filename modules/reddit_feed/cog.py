@@ -1,7 +1,9 @@
 import datetime
+import os
 import time
 from typing import Optional
 
+import nextcord
 from nextcord.ext.tasks import loop
 from nextcord.ext import commands
 
@@ -9,12 +11,26 @@ import asyncpraw
 from asyncprawcore.exceptions import AsyncPrawcoreException
 import asyncpraw.exceptions
 
-from modules.reddit_feed.reddit_post import RedditPost
+from modules.reddit_feed.announcement_cache import AnnouncementCache
+from modules.reddit_feed.edit_watcher import EditWatcher
+from modules.reddit_feed.outbox import Outbox
+from modules.reddit_feed.poll_scheduler import PollScheduler, find_release_times
+from modules.reddit_feed.reddit_post import RedditPost, edit_announcement
+from modules.reddit_feed.seen_store import SeenStore
+from utils.embedder import build_embed
 import config
 
 # Reddit feed settings
-CHECK_INTERVAL = 5  # seconds to wait before checking again
-SUBMISSION_LIMIT = 5  # number of submissions to check
+CHECK_INTERVAL = 5  # seconds to wait before checking again around puzzle releases
+IDLE_INTERVAL = 60  # seconds to wait before checking again the rest of the time
+SUBMISSION_LIMIT = 5  # number of submissions to check per subreddit
+SEEN_STORE_PATH = "reddit_feed_seen.sqlite3"  # ids of the submissions that have been handled, in config.STATE_DIR
+ANNOUNCEMENTS_PATH = "reddit_feed_announcements.sqlite3"  # which message each submission was announced in, in STATE_DIR
+ANNOUNCEMENT_CACHE_SIZE = 100  # number of rendered announcements to keep
+OUTBOX_PATH = "reddit_feed_outbox.sqlite3"  # announcements waiting to be sent and published, in STATE_DIR
+EDIT_CHECK_INTERVAL = 60  # seconds to wait before checking recent posts for edits again
+EDIT_WATCH_SIZE = 10  # number of recently announced posts to check for edits
+FEED_SUBREDDITS = "+".join(config.REDDIT_FEEDS)  # eg. "arithmancy+otherhunt", all fetched in one request
 
 # initialize AsyncPraw reddit api
 reddit = asyncpraw.Reddit(
@@ -26,17 +42,46 @@ reddit = asyncpraw.Reddit(
 )
 
 
+def get_rate_limit():
+	"""(requests left, unix time the window resets) from asyncpraw's rate limiter, or Nones before the first request"""
+	limiter = reddit._core._rate_limiter
+	return limiter.remaining, limiter.reset_timestamp
+
+
+def format_latency(latencies):
+	"""mean and max of some latencies in seconds, for !feedstats"""
+	if not latencies:
+		return "no latency yet"
+	return f"{sum(latencies) / len(latencies):.1f}s mean, {max(latencies):.1f}s max latency"
+
+
 class RedditFeedCog(commands.Cog, name="Reddit Feed"):
 	"""Checks for `resend` command and starts Reddit feed loop to check submissions"""
 
 	def __init__(self, bot):
 		self.bot = bot
+		os.makedirs(config.STATE_DIR, exist_ok=True)
+		self.seen = SeenStore(os.path.join(config.STATE_DIR, SEEN_STORE_PATH))
+		# with nothing in the store (the first run, or STATE_DIR isn't persistent), there's no telling which posts
+		# were already announced. Only posts made from now on are announced, rather than the newest in every feed
+		self.skip_before = time.time() if len(self.seen) == 0 else None
+		self.scheduler = PollScheduler(fast=CHECK_INTERVAL, slow=IDLE_INTERVAL)
+		# ids of the announcement posts whose schedules have been read
+		self.schedules_read = set()
+		self.announcements = AnnouncementCache(os.path.join(config.STATE_DIR, ANNOUNCEMENTS_PATH), ANNOUNCEMENT_CACHE_SIZE)
+		self.edits = EditWatcher(EDIT_WATCH_SIZE)
+		self.outbox = Outbox(bot, os.path.join(config.STATE_DIR, OUTBOX_PATH), self.announcements)
 
 	@commands.Cog.listener()
 	async def on_ready(self):
 		"""When discord is connected"""
-		# Start Reddit loop
-		self.reddit_feed.start()
+		# Send whatever was waiting in the outbox when the bot stopped
+		self.outbox.start()
+		# Start Reddit loops. on_ready fires again whenever the bot reconnects, but they keep running through that
+		if not self.reddit_feed.is_running():
+			self.reddit_feed.start()
+		if not self.watch_edits.is_running():
+			self.watch_edits.start()
 
 	def is_in_guild(guild_id):
 		"""check that command is in a guild"""
@@ -49,43 +94,171 @@ class RedditFeedCog(commands.Cog, name="Reddit Feed"):
 	@commands.command(name="resend")
 	@commands.has_permissions(administrator=True)
 	@is_in_guild(config.GUILD_ID)
-	async def resend(self, ctx: commands.Context, message_id: Optional[int] = None):
-		"""Command to resend the last post again.
+	async def resend(self, ctx: commands.Context, post_or_message_id: Optional[str] = None):
+		"""Command to resend an announcement.
+		`!resend` sends the latest post again, `!resend <message id>` replaces that announcement with the latest
+		post, and `!resend <submission id>` updates the announcement of that post, or sends it if there isn't one.
 		Invoked with !resend"""
 		# log command in console
 		print("Received resend command")
-		# respond to command
-		await ctx.send("Resending last announcement!")
-		# check for last submission in subreddit
-		subreddit = await reddit.subreddit(config.SUB)
-		async for submission in subreddit.new(limit=1):
-			# process submission
-			await RedditPost(self.bot, submission).process_post(message_id)
+		# message ids are snowflakes, much longer than submission ids
+		if post_or_message_id is None or (post_or_message_id.isdigit() and len(post_or_message_id) > 15):
+			message_id = int(post_or_message_id) if post_or_message_id else None
+			subreddits = FEED_SUBREDDITS
+			if message_id:
+				# replace the message with the latest post of the feed it was announced in
+				subreddits = await self.find_feed(message_id)
+				if subreddits is None:
+					await ctx.send(f"Couldn't find a message with the id {message_id} in any announcements channel.")
+					return
+			# respond to command
+			await ctx.send("Resending last announcement!")
+			# check for last submission in the subreddits
+			subreddit = await reddit.subreddit(subreddits)
+			async for submission in subreddit.new(limit=1):
+				# process submission
+				await RedditPost(self.bot, submission, self.announcements, self.outbox).process_post(message_id)
+			return
+		submission_id = post_or_message_id.removeprefix("t3_")
+		await ctx.send(f"Resending announcement for https://redd.it/{submission_id}!")
+		# posts announced since the bot started don't need to be fetched or formatted again
+		cached = self.announcements.get(submission_id)
+		if cached is not None:
+			channel_id, rendered = cached
+		else:
+			try:
+				submission = await reddit.submission(submission_id)
+			except AsyncPrawcoreException:
+				await ctx.send(f"Couldn't find a post with the id {submission_id}.")
+				return
+			post = RedditPost(self.bot, submission, self.announcements, self.outbox)
+			channel_id, rendered = post.channel_id, post.render()
+		announced = self.announcements.get_message(submission_id)
+		if announced is not None:
+			try:
+				await edit_announcement(self.bot, *announced, rendered)
+				return
+			except nextcord.NotFound:
+				# the announcement was deleted, so send a new one
+				pass
+		self.outbox.put(submission_id, channel_id, rendered)
+
+	async def find_feed(self, message_id: int) -> Optional[str]:
+		"""subreddit whose announcements channel has a message in it, or None if none of them do"""
+		for sub, channel_id in config.REDDIT_FEEDS.items():
+			channel: nextcord.TextChannel = self.bot.get_channel(channel_id)
+			if channel is None:
+				continue
+			try:
+				await channel.fetch_message(message_id)
+				return sub
+			except (nextcord.NotFound, nextcord.Forbidden):
+				continue
+		return None
+
+	@commands.command(name="feedstats")
+	@commands.has_permissions(administrator=True)
+	@is_in_guild(config.GUILD_ID)
+	async def feedstats(self, ctx: commands.Context):
+		"""Command to show how the Reddit feed is polling.
+		Invoked with !feedstats"""
+		scheduler = self.scheduler
+		remaining, reset_timestamp = get_rate_limit()
+		hours = (time.time() - scheduler.started) / 3600
+		description = (
+			f"Polls: {scheduler.polls} ({scheduler.polls / hours:.0f}/hour)\n"
+			f"New posts: {scheduler.hits}\n"
+			f"Errors: {scheduler.errors}\n"
+			f"Polling every {scheduler.delay:.0f} seconds ({'busy' if scheduler.is_busy() else 'idle'})\n"
+			f"Upcoming releases: {sum(1 for t in scheduler.releases if t > time.time())}"
+		)
+		outbox = self.outbox
+		description += (
+			f"\nOutbox: {outbox.unsent} to send, {outbox.unpublished} to publish\n"
+			f"Sent: {outbox.sent}, {format_latency(outbox.send_latencies)}\n"
+			f"Published: {outbox.published}, {format_latency(outbox.publish_latencies)}\n"
+			f"Gave up on: {outbox.failed}"
+		)
+		if remaining is not None:
+			description += (
+				f"\nRate limit: {remaining:.0f} requests left, resets in "
+				f"{max(0, reset_timestamp - time.time()):.0f} seconds"
+			)
+		await ctx.send(embed=build_embed("Reddit Feed Stats", description))
 
 	@loop(seconds=CHECK_INTERVAL)
 	async def reddit_feed(self):
-		"""loop every few seconds to check for new submissions"""
+		"""loop to check for new submissions, more often around puzzle releases"""
+		hits = 0
 		try:
-			# check for new submission in subreddit
-			subreddit = await reddit.subreddit(config.SUB)
-			async for submission in subreddit.new(limit=SUBMISSION_LIMIT):
+			# check for new submissions in every subreddit at once, with one combined listing
+			subreddit = await reddit.subreddit(FEED_SUBREDDITS)
+			async for submission in subreddit.new(limit=SUBMISSION_LIMIT * len(config.REDDIT_FEEDS)):
+				# learn when puzzles come out from the schedule in announcement posts
+				if submission.id not in self.schedules_read and "announcements" in str(submission.title).lower():
+					self.schedules_read.add(submission.id)
+					self.scheduler.add_releases(find_release_times(submission.selftext))
 				# check if the post has been seen before
-				if not submission.saved:
-					# save post to mark as seen
-					await submission.save()
-					# process submission
-					await RedditPost(self.bot, submission).process_post()
+				if submission.id in self.seen:
+					continue
+				# mark as seen first, so a failed announcement isn't sent again every loop
+				self.seen.add(submission.id)
+				if self.skip_before is not None and submission.created_utc < self.skip_before:
+					continue
+				# process submission
+				await RedditPost(self.bot, submission, self.announcements, self.outbox).process_post()
+				self.edits.watch(submission)
+				hits += 1
+			self.scheduler.record_poll(hits)
+		except AsyncPrawcoreException as err:
+			print(f"EXCEPTION: AsyncPrawcoreException. {err}")
+			self.scheduler.record_error()
+		# the loop waits this long before the next check, without blocking anything else
+		self.reddit_feed.change_interval(seconds=self.scheduler.next_delay(*get_rate_limit()))
+
+	@loop(seconds=EDIT_CHECK_INTERVAL)
+	async def watch_edits(self):
+		"""loop to update the announcements of recent posts that have been edited since"""
+		fullnames = self.edits.fullnames()
+		if not fullnames:
+			return
+		try:
+			# every watched post comes back from a single request
+			async for submission in reddit.info(fullnames=fullnames):
+				if not self.edits.changed(submission):
+					continue
+				# a fixed schedule can move puzzle releases
+				if "announcements" in str(submission.title).lower():
+					self.scheduler.add_releases(find_release_times(submission.selftext))
+				previous = self.announcements.get(submission.id)
+				rendered = RedditPost(self.bot, submission, self.announcements, self.outbox).render()
+				announced = self.announcements.get_message(submission.id)
+				if announced is None:
+					# still waiting in the outbox, so send the new version instead
+					self.outbox.replace(submission.id, rendered)
+					continue
+				# the edit may not show in the announcement, eg. if it's past where the text is trimmed
+				if previous is not None and previous[1] == rendered:
+					continue
+				try:
+					await edit_announcement(self.bot, *announced, rendered)
+					print(f"Edited announcement for https://redd.it/{submission.id}")
+				except nextcord.NotFound:
+					print(f"Announcement for https://redd.it/{submission.id} was deleted")
 		except AsyncPrawcoreException as err:
 			print(f"EXCEPTION: AsyncPrawcoreException. {err}")
-			time.sleep(10)
 
 	@reddit_feed.before_loop
 	async def reddit_feed_init(self):
 		"""print startup info before reddit feed loop begins"""
 		print(f"Logged in: {str(datetime.datetime.now())[:-7]}")
 		print(f"Timezone: {time.tzname[time.localtime().tm_isdst]}")
-		print(f"Subreddit: {config.SUB}")
-		print(f"Checking {SUBMISSION_LIMIT} posts every {CHECK_INTERVAL} seconds")
+		for sub, channel_id in config.REDDIT_FEEDS.items():
+			print(f"Subreddit: r/{sub} -> channel {channel_id}")
+		print(
+			f"Checking {SUBMISSION_LIMIT} posts every {CHECK_INTERVAL} seconds around puzzle releases, "
+			f"every {IDLE_INTERVAL} seconds otherwise"
+		)
 
 
 def setup(bot):
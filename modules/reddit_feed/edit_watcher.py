@@ -0,0 +1,51 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List
+
+
+def hash_selftext(selftext: str) -> str:
+	return hashlib.sha256(selftext.encode("utf-8")).hexdigest()
+
+
+class EditWatcher:
+	"""Keeps track of the posts announced most recently, to catch edits made to them afterwards
+
+	Schedule fixes and results corrections come in soon after a post, so only the last `size` posts announced in the
+	past `max_age` seconds are watched. They're all fetched together in one request, and a post only counts as
+	changed if the hash of its text is different from the last time it was looked at."""
+
+	def __init__(self, size: int = 10, max_age: float = 3 * 24 * 60 * 60):
+		self.size = size
+		self.max_age = max_age
+		# submission id -> (time it was announced, hash of its selftext), oldest first
+		self._watched = OrderedDict()
+
+	def __len__(self):
+		return len(self._watched)
+
+	def watch(self, submission):
+		"""start watching a post that was just announced"""
+		self._watched[submission.id] = (time.time(), hash_selftext(submission.selftext))
+		self._watched.move_to_end(submission.id)
+		while len(self._watched) > self.size:
+			self._watched.popitem(last=False)
+
+	def fullnames(self) -> List[str]:
+		"""fullnames of the posts to fetch, forgetting the ones that are too old to be watched anymore"""
+		cutoff = time.time() - self.max_age
+		for submission_id in [id for id, (announced, _) in self._watched.items() if announced < cutoff]:
+			del self._watched[submission_id]
+		return [f"t3_{submission_id}" for submission_id in self._watched]
+
+	def changed(self, submission) -> bool:
+		"""whether a fetched post's text is different from the last time, remembering the new text if so"""
+		entry = self._watched.get(submission.id)
+		if entry is None:
+			return False
+		announced, old_hash = entry
+		new_hash = hash_selftext(submission.selftext)
+		if new_hash == old_hash:
+			return False
+		self._watched[submission.id] = (announced, new_hash)
+		return True
@@ -0,0 +1,87 @@
+import re
+from typing import List
+
+from table2ascii import Alignment, table2ascii
+
+# a row of a results table: five cells, each followed by a pipe, eg. "Puzzle 1 | 10 | 20 | 30 | 40 |",
+# with or without a pipe in front
+ROW_REGEX = re.compile(r"\s*\|?([^|]*)\|([^|]*)\|([^|]*)\|([^|]*)\|([^|]*)\|\s*")
+
+# a cell of the line between the header and the body, eg. ":-:" or "--:"
+SEPARATOR_REGEX = re.compile(r":?-+:?")
+
+# cell subtitutions, to keep the tables narrow enough for Discord
+CELL_SUBSTITUTIONS = {
+	"Level": "#",
+	"Gryffindor": "G",
+	"Hufflepuff": "H",
+	"Ravenclaw": "R",
+	"Slytherin": "S",
+	"Puzzle 1": "1",
+	"Puzzle 2": "2",
+	"Puzzle 3": "3",
+	"Puzzle 4": "4",
+	"Puzzle 5": "5",
+	"Arithmancy Points": "SUM",
+	"House": "",
+	"House Points": "HPs",
+}
+
+
+def render_table(rows: List[List[str]]) -> str:
+	"""render the rows of a markdown table as a unicode table in a code block, or "" if it has no rows.
+	The first row is the header and, if there are more than two, the last one is the footer"""
+	table_data = []
+	for row in rows:
+		# strip and remove "**" from each cell, and replace cell values with substitutions
+		row = [CELL_SUBSTITUTIONS.get(cell, cell) for cell in (cell.strip().replace("**", "") for cell in row)]
+		# if the row is the line under the header, don't add it to the table
+		if all(SEPARATOR_REGEX.fullmatch(cell) for cell in row):
+			continue
+		table_data.append(row)
+		# the rest of the table comes after the total
+		if "SUM" in row:
+			break
+	if not table_data:
+		return ""
+	table = table2ascii(
+		header=table_data[0],
+		body=table_data[1:-1] if len(table_data) > 2 else table_data[1:],
+		footer=table_data[-1] if len(table_data) > 2 else None,
+		first_col_heading=True,
+		alignments=[Alignment.CENTER] + [Alignment.RIGHT] * 4,
+	)
+	return f"```ml\n{table}\n```"
+
+
+def _add_table(output: List[str], rows: List[List[str]]):
+	"""render a table at the end of the output, in place of the blank lines before it"""
+	while output and not output[-1].strip():
+		output.pop()
+	table = render_table(rows)
+	if table:
+		output.append(table)
+
+
+def format_tables(text: str) -> str:
+	"""replace each markdown table in the text with a unicode table, in a single pass over its lines.
+	Blank lines around a table are dropped, since the code block already sets it apart"""
+	output = []
+	rows = []
+	after_table = False
+	for line in text.split("\n"):
+		match = ROW_REGEX.fullmatch(line)
+		if match:
+			rows.append(match.groups())
+			continue
+		if rows:
+			_add_table(output, rows)
+			rows = []
+			after_table = True
+		if after_table and not line.strip():
+			continue
+		after_table = False
+		output.append(line)
+	if rows:
+		_add_table(output, rows)
+	return "\n".join(output)
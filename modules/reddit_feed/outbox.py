@@ -0,0 +1,238 @@
+import asyncio
+import sqlite3
+import time
+import traceback
+from collections import defaultdict, deque
+from typing import Optional
+
+import aiohttp
+import nextcord
+from modules.reddit_feed.announcement_cache import AnnouncementCache, Rendered
+from utils.embedder import build_embed
+
+
+class Outbox:
+	"""Announcements waiting to be sent and published, kept in an SQLite table so a restart doesn't lose any
+
+	Sends go out in the order they were queued, at most one every `send_interval` seconds, so a burst of posts
+	doesn't run into Discord's per-channel send limit. Publishing (crossposting from a news channel) is limited to
+	`publish_limit` per channel every `publish_window` seconds, so publishes are counted against that and wait for
+	room in it, in a separate task so that a full publish bucket never holds up the next announcement. Failed sends
+	and publishes are retried with a growing delay, up to `send_attempts` and `publish_attempts` times, except for
+	errors that won't go away by trying again (4xx responses other than 429), which drop the announcement."""
+
+	def __init__(
+		self,
+		bot,
+		path,
+		announcements: Optional[AnnouncementCache] = None,
+		send_interval: float = 1,
+		publish_limit: int = 10,
+		publish_window: float = 60 * 60,
+		send_attempts: int = 5,
+		publish_attempts: int = 5,
+	):
+		self.bot = bot
+		self.announcements = announcements
+		self.send_interval = send_interval
+		self.publish_limit = publish_limit
+		self.publish_window = publish_window
+		self.send_attempts = send_attempts
+		self.publish_attempts = publish_attempts
+		self._db = sqlite3.connect(path)
+		self._db.execute(
+			"CREATE TABLE IF NOT EXISTS outbox ("
+			"id INTEGER PRIMARY KEY AUTOINCREMENT, submission_id TEXT NOT NULL, channel_id INTEGER NOT NULL, "
+			"title TEXT NOT NULL, description TEXT NOT NULL, url TEXT NOT NULL, queued_at REAL NOT NULL, "
+			"message_id INTEGER, attempts INTEGER NOT NULL DEFAULT 0, retry_at REAL NOT NULL DEFAULT 0)"
+		)
+		# channel id -> times of the publishes in it during the last window
+		self._publishes = defaultdict(deque)
+		# made once the event loop is running
+		self._queued = None
+		self._sent = None
+		self._tasks = []
+		# metrics
+		self.sent = 0
+		self.published = 0
+		self.failed = 0
+		# seconds from being queued to being sent, and to being published, for the most recent announcements
+		self.send_latencies = deque(maxlen=100)
+		self.publish_latencies = deque(maxlen=100)
+
+	def start(self):
+		"""start sending and publishing, picking up whatever was left in the outbox"""
+		if any(not task.done() for task in self._tasks):
+			return
+		self._queued = asyncio.Event()
+		self._sent = asyncio.Event()
+		self._tasks = [asyncio.create_task(self._send_worker()), asyncio.create_task(self._publish_worker())]
+
+	async def stop(self):
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._tasks = []
+
+	def put(self, submission_id: str, channel_id: int, rendered: Rendered):
+		"""queue an announcement"""
+		title, description, url = rendered
+		with self._db:
+			self._db.execute(
+				"INSERT INTO outbox (submission_id, channel_id, title, description, url, queued_at) "
+				"VALUES (?, ?, ?, ?, ?, ?)",
+				(submission_id, channel_id, title, description, url, time.time()),
+			)
+		if self._queued is not None:
+			self._queued.set()
+
+	def replace(self, submission_id: str, rendered: Rendered) -> bool:
+		"""update an announcement that hasn't been sent yet. Returns whether there was one"""
+		title, description, url = rendered
+		with self._db:
+			cursor = self._db.execute(
+				"UPDATE outbox SET title = ?, description = ?, url = ? WHERE submission_id = ? AND message_id IS NULL",
+				(title, description, url, submission_id),
+			)
+		return cursor.rowcount > 0
+
+	@property
+	def unsent(self) -> int:
+		return self._db.execute("SELECT COUNT(*) FROM outbox WHERE message_id IS NULL").fetchone()[0]
+
+	@property
+	def unpublished(self) -> int:
+		return self._db.execute("SELECT COUNT(*) FROM outbox WHERE message_id IS NOT NULL").fetchone()[0]
+
+	def _remove(self, row_id: int):
+		with self._db:
+			self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+	async def _wait(self, event: asyncio.Event, timeout: Optional[float] = None):
+		"""wait until there's something new to do, or for timeout seconds"""
+		try:
+			await asyncio.wait_for(event.wait(), timeout)
+		except asyncio.TimeoutError:
+			pass
+		event.clear()
+
+	async def _send_worker(self):
+		while True:
+			try:
+				await self._send_next()
+			except asyncio.CancelledError:
+				raise
+			except Exception as err:
+				# keep sending whatever goes wrong, eg. the database being locked
+				print(f"EXCEPTION: Outbox failed to send. {err}")
+				traceback.print_exc()
+				await asyncio.sleep(self.send_interval * 30)
+
+	async def _send_next(self):
+		row = self._db.execute(
+			"SELECT id, submission_id, channel_id, title, description, url, queued_at, attempts, retry_at FROM outbox "
+			"WHERE message_id IS NULL ORDER BY id LIMIT 1"
+		).fetchone()
+		if row is None:
+			await self._wait(self._queued)
+			return
+		row_id, submission_id, channel_id, title, description, url, queued_at, attempts, retry_at = row
+		if retry_at > time.time():
+			# announcements go out in order, so the rest wait for this one to be retried
+			await asyncio.sleep(retry_at - time.time())
+			return
+		channel: nextcord.TextChannel = self.bot.get_channel(channel_id)
+		if channel is None:
+			print(f"Can't find channel {channel_id} to announce https://redd.it/{submission_id} in")
+			self._remove(row_id)
+			return
+		try:
+			message: nextcord.Message = await channel.send(embed=build_embed(title, description, url=url))
+		except (nextcord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as err:
+			self._failed(
+				row_id, submission_id, "announce", attempts, self.send_attempts, self.send_interval * 30, None, err
+			)
+			return
+		self.sent += 1
+		self.send_latencies.append(time.time() - queued_at)
+		with self._db:
+			self._db.execute(
+				"UPDATE outbox SET message_id = ?, attempts = 0, retry_at = 0 WHERE id = ?", (message.id, row_id)
+			)
+		if self.announcements is not None:
+			self.announcements.set_message(submission_id, channel_id, message.id)
+		self._sent.set()
+		await asyncio.sleep(self.send_interval)
+
+	def _failed(self, row_id, submission_id, action, attempts, max_attempts, delay, max_delay, err):
+		"""retry a failed send or publish after `delay` seconds, doubled every attempt up to `max_delay`, or give up"""
+		attempts += 1
+		# a 4xx other than a rate limit, eg. an embed that's too long, fails the same way every time
+		permanent = isinstance(err, nextcord.HTTPException) and 400 <= err.status < 500 and err.status != 429
+		if permanent or attempts >= max_attempts:
+			print(f"EXCEPTION: Gave up trying to {action} https://redd.it/{submission_id}. {err}")
+			self.failed += 1
+			self._remove(row_id)
+			return
+		print(f"EXCEPTION: Failed to {action} https://redd.it/{submission_id}, retrying. {err}")
+		delay *= 2 ** (attempts - 1)
+		retry_at = time.time() + (min(delay, max_delay) if max_delay is not None else delay)
+		with self._db:
+			self._db.execute("UPDATE outbox SET attempts = ?, retry_at = ? WHERE id = ?", (attempts, retry_at, row_id))
+
+	def _publish_bucket_free_at(self, channel_id: int, now: float) -> float:
+		"""when there's room in a channel's publish bucket"""
+		publishes = self._publishes[channel_id]
+		while publishes and publishes[0] <= now - self.publish_window:
+			publishes.popleft()
+		if len(publishes) < self.publish_limit:
+			return now
+		return publishes[0] + self.publish_window
+
+	async def _publish_worker(self):
+		while True:
+			try:
+				await self._publish_next()
+			except asyncio.CancelledError:
+				raise
+			except Exception as err:
+				print(f"EXCEPTION: Outbox failed to publish. {err}")
+				traceback.print_exc()
+				await asyncio.sleep(self.send_interval * 30)
+
+	async def _publish_next(self):
+		now = time.time()
+		rows = self._db.execute(
+			"SELECT id, submission_id, channel_id, message_id, queued_at, attempts, retry_at FROM outbox "
+			"WHERE message_id IS NOT NULL ORDER BY id"
+		).fetchall()
+		# the soonest a waiting publish can go
+		wake_at = None
+		for row in rows:
+			ready_at = max(row[6], self._publish_bucket_free_at(row[2], now))
+			if ready_at <= now:
+				await self._publish(*row[:6])
+				return
+			wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+		await self._wait(self._sent, wake_at - now if wake_at is not None else None)
+
+	async def _publish(self, row_id, submission_id, channel_id, message_id, queued_at, attempts):
+		channel: nextcord.TextChannel = self.bot.get_channel(channel_id)
+		if channel is None or not channel.is_news():
+			# only announcements in news channels can be published
+			self._remove(row_id)
+			return
+		try:
+			await channel.get_partial_message(message_id).publish()
+		except nextcord.NotFound:
+			# the announcement was deleted before it could be published
+			self._remove(row_id)
+			return
+		except (nextcord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as err:
+			self._failed(row_id, submission_id, "publish", attempts, self.publish_attempts, 120, self.publish_window, err)
+			return
+		now = time.time()
+		self._publishes[channel_id].append(now)
+		self.published += 1
+		self.publish_latencies.append(now - queued_at)
+		self._remove(row_id)
@@ -0,0 +1,104 @@
+import random
+import re
+import time
+from typing import Iterable, List, Optional
+
+import pytz
+from utils.dates import parse_date
+
+# rows of the schedule table in announcement posts: puzzle | release time | end time |
+SCHEDULE_REGEX = re.compile(r"([^|]*?)\|([^|]*?\d, [^|]*?)\|([^|]*?\d, [^|]*?)\|")
+
+# times without a timezone are assumed to be in the hunt's timezone
+DEFAULT_TIMEZONE = pytz.timezone("US/Eastern")
+
+
+def find_release_times(selftext: str) -> List[float]:
+	"""return the puzzle release and end times in an announcement post's schedule, as unix timestamps"""
+	times = []
+	for _, release, end in SCHEDULE_REGEX.findall(selftext):
+		for date_str in (release, end):
+			date = parse_date(date_str.strip().replace("**", ""))
+			if date is None:
+				continue
+			if date.tzinfo is None:
+				date = DEFAULT_TIMEZONE.localize(date)
+			times.append(date.timestamp())
+	return times
+
+
+class PollScheduler:
+	"""Decides how long the feed waits before polling Reddit again
+
+	Posts come in around puzzle releases (and results after them), so the feed polls every `fast` seconds from
+	`lead` seconds before a release until `linger` seconds after it, and for `linger` seconds after any new post.
+	The rest of the time it polls every `slow` seconds. Failed polls back off exponentially, with jitter so retries
+	don't line up with anyone else's, and polls are spread out further if Reddit's rate limit is running low.
+	Also keeps the counts shown by `!feedstats`."""
+
+	def __init__(
+		self,
+		fast: float = 5,
+		slow: float = 60,
+		lead: float = 600,
+		linger: float = 1800,
+		backoff_base: float = 10,
+		backoff_max: float = 600,
+	):
+		self.fast = fast
+		self.slow = slow
+		self.lead = lead
+		self.linger = linger
+		self.backoff_base = backoff_base
+		self.backoff_max = backoff_max
+		# release times learned from announcement posts, as unix timestamps
+		self.releases = set()
+		self.last_hit: Optional[float] = None
+		self.failures = 0
+		# metrics
+		self.polls = 0
+		self.hits = 0
+		self.errors = 0
+		self.started = time.time()
+		self.delay = fast
+
+	def add_releases(self, times: Iterable[float]):
+		"""remember release times, dropping ones that are long gone"""
+		now = time.time()
+		self.releases = {t for t in self.releases.union(times) if t + self.linger > now}
+
+	def record_poll(self, hits: int):
+		"""count a successful poll that found `hits` new posts"""
+		self.polls += 1
+		self.hits += hits
+		self.failures = 0
+		if hits:
+			self.last_hit = time.time()
+
+	def record_error(self):
+		"""count a failed poll"""
+		self.polls += 1
+		self.errors += 1
+		self.failures += 1
+
+	def is_busy(self, now: Optional[float] = None) -> bool:
+		"""whether a post is likely soon: near a release, or just after a post"""
+		now = now or time.time()
+		if self.last_hit is not None and now - self.last_hit < self.linger:
+			return True
+		return any(t - self.lead <= now <= t + self.linger for t in self.releases)
+
+	def next_delay(self, remaining: Optional[float] = None, reset_timestamp: Optional[float] = None) -> float:
+		"""seconds to wait before the next poll, given the requests left in Reddit's rate limit window"""
+		now = time.time()
+		if self.failures:
+			backoff = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+			# equal jitter: at least half the backoff, so retries never come too quickly
+			delay = backoff / 2 + random.uniform(0, backoff / 2)
+		else:
+			delay = self.fast if self.is_busy(now) else self.slow
+		if remaining is not None and reset_timestamp is not None and reset_timestamp > now:
+			# spread what's left of the rate limit over the rest of the window
+			delay = max(delay, (reset_timestamp - now) / max(remaining, 1))
+		self.delay = delay
+		return delay
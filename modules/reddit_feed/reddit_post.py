@@ -4,49 +4,69 @@ from typing import Optional
 
 import config
 import nextcord
-from table2ascii import Alignment, table2ascii
+from modules.reddit_feed.announcement_cache import AnnouncementCache, Rendered
+from modules.reddit_feed.markdown_tables import format_tables
 from utils.embedder import build_embed
 
+# keyword in the title -> formatter, for the subreddits whose posts follow r/Arithmancy's layouts (REDDIT_SUB's).
+# Posts in any other subreddit (or without a keyword) are just trimmed
+SUBREDDIT_FORMATTERS = {
+	config.SUB.lower(): ("announcements", "results"),
+}
+
+
+async def edit_announcement(bot, channel_id: int, message_id: int, rendered: Rendered):
+	"""replace an announcement with a newly rendered one"""
+	title, description, url = rendered
+	channel: nextcord.TextChannel = bot.get_channel(channel_id)
+	message: nextcord.Message = await channel.fetch_message(message_id)
+	embed = build_embed(title, description, url=url)
+	await message.edit(embed=embed)
+
 
 class RedditPost:
-	def __init__(self, bot, post):
+	def __init__(self, bot, post, announcements: Optional[AnnouncementCache] = None, outbox=None):
 		self.bot = bot
 		self.post = post
 		self.post_url = f"https://redd.it/{post.id}"
+		self.subreddit = post.subreddit.display_name.lower()
+		# announce in the channel for the post's subreddit
+		self.channel_id = config.REDDIT_FEEDS.get(self.subreddit, config.ANNOUNCEMENTS_CHANNEL_ID)
+		# rendered announcements and where they were sent, if they're being kept track of
+		self.announcements = announcements
+		# new announcements are sent and published by the outbox, which is only needed for process_post
+		self.outbox = outbox
 
 	async def process_post(self, message_id: Optional[int] = None):
 		"""check post and announce if not saved"""
 		# log post details in console
 		print(f"Recieved post by {self.post.author} at {self.__get_date()}")
 		# create message with url and text
-		title, message = self.__build_message()
+		rendered = self.render()
 		if not message_id:
-			# send to discord announcements
-			await self.__announce(title, message)
+			# queue for discord announcements
+			self.outbox.put(self.post.id, self.channel_id, rendered)
 			# log announcement status in console
-			print(f"Sent announcement.")
+			print(f"Queued announcement.")
 		else:
 			# edit announcement
-			await self.__edit_announcement(title, message, message_id)
+			await edit_announcement(self.bot, self.channel_id, message_id, rendered)
+			if self.announcements is not None:
+				self.announcements.set_message(self.post.id, self.channel_id, message_id)
 			# log announcement status in console
 			print(f"Edited announcement.")
 
-	async def __announce(self, title: str, description: str):
-		"""send message in announcements channel"""
-		channel: nextcord.TextChannel = self.bot.get_channel(config.ANNOUNCEMENTS_CHANNEL_ID)
-		embed = build_embed(title, description, url=self.post_url)
-		message: nextcord.Message = await channel.send(embed=embed)
-		try:
-			await message.publish()
-		except Exception:
-			pass
-
-	async def __edit_announcement(self, title: str, description: str, message_id: int):
-		"""edit message in announcements channel"""
-		channel: nextcord.TextChannel = self.bot.get_channel(config.ANNOUNCEMENTS_CHANNEL_ID)
-		message: nextcord.Message = await channel.fetch_message(message_id)
-		embed = build_embed(title, description, url=self.post_url)
-		await message.edit(embed=embed)
+	def render(self) -> Rendered:
+		"""(title, description, url) of the post's announcement, only formatted again if the post has changed"""
+		if self.announcements is not None:
+			cached = self.announcements.get(self.post.id, self.post.edited)
+			if cached is not None:
+				return cached[1]
+		title, message = self.__build_message()
+		rendered = (title, message, self.post_url)
+		if self.announcements is not None:
+			self.announcements.put(self.post.id, self.post.edited, self.channel_id, rendered)
+		return rendered
 
 	def __get_date(self):
 		"""convert post date to readable timestamp"""
@@ -104,72 +124,8 @@ class RedditPost:
 			# replace any \r with or without \n with \n
 			selftext = re.sub(r"\r\n?", "\n", selftext)
 
-			# replace markdown table with ascii tables
-			table_replacement_string = ""
-			table_regex = r"(?:^\s*([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|\s*)+"
-			while re.search(table_regex, selftext, re.MULTILINE):
-				# find points in post text
-				points_match = re.findall(
-					r"^\s*([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|([^|\n]*)\|",
-					selftext,
-					re.MULTILINE,
-				)
-				if points_match:
-					points_table_data = []
-					# cell subtitutions
-					substitutions = {
-						"Level": "#",
-						"Gryffindor": "G",
-						"Hufflepuff": "H",
-						"Ravenclaw": "R",
-						"Slytherin": "S",
-						"Puzzle 1": "1",
-						"Puzzle 2": "2",
-						"Puzzle 3": "3",
-						"Puzzle 4": "4",
-						"Puzzle 5": "5",
-						"Arithmancy Points": "SUM",
-						"House": "",
-						"House Points": "HPs",
-					}
-					for row in points_match:
-						# strip and remove "**" from each cell
-						row = [cell.strip().replace("**", "") for cell in row]
-						# replace cell values with substitutions
-						row = [substitutions.get(cell, cell) for cell in row]
-						# if the row contains :-:, don't add it to the table
-						if ":-:" in row:
-							continue
-						points_table_data.append(row)
-						# if the row contains "SUM", break the loop
-						if "SUM" in row:
-							break
-					if len(points_table_data) > 0:
-						header = points_table_data[0]
-						body = (
-							points_table_data[1:-1]
-							if len(points_table_data) > 2
-							else points_table_data[1:]
-						)
-						footer = points_table_data[-1] if len(points_table_data) > 2 else None
-						# create unicode table
-						table = table2ascii(
-							header=header,
-							body=body,
-							footer=footer,
-							first_col_heading=True,
-							alignments=[Alignment.CENTER] + [Alignment.RIGHT] * 4,
-						)
-						table_replacement_string += f"```ml\n" + table + "\n```\n"
-				selftext = re.sub(
-					table_regex,
-					"[[[TABLE_REPLACEMENT]]]",
-					selftext,
-					flags=re.MULTILINE,
-					count=1,
-				)
-			# replace markdown tables
-			selftext = selftext.replace("[[[TABLE_REPLACEMENT]]]", table_replacement_string)
+			# replace markdown tables with ascii tables
+			selftext = format_tables(selftext)
 			# trim text if over limit of characters
 			trim_length = max(600, selftext.find("Level Results"))
 			selftext = trim_text(selftext, trim_length)
@@ -187,7 +143,7 @@ class RedditPost:
 			"announcements": format_announcements_post,
 			"results": format_results_post,
 		}
-		for keyword in formatters.keys():
+		for keyword in SUBREDDIT_FORMATTERS.get(self.subreddit, ()):
 			if keyword in str(self.post.title).lower():
 				return formatters[keyword](self.post)
 		return default_formatter(self.post)
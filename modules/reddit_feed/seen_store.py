@@ -0,0 +1,44 @@
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+class SeenStore:
+	"""Remembers which submissions the feed has already handled, so each one is only announced once
+
+	Ids are kept in an SQLite table, so they survive restarts, with the most recently checked ones in an in-memory LRU
+	in front of it. The feed only ever looks at the newest few posts, so almost every check is answered from memory
+	without touching the database, let alone Reddit."""
+
+	def __init__(self, path, cache_size=1000):
+		self.path = path
+		self.cache_size = cache_size
+		# Submission id -> whether it has been seen, most recently checked last
+		self._cache = OrderedDict()
+		self._db = sqlite3.connect(path)
+		self._db.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+
+	def _remember(self, submission_id, seen):
+		self._cache[submission_id] = seen
+		self._cache.move_to_end(submission_id)
+		if len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+
+	def __contains__(self, submission_id):
+		seen = self._cache.get(submission_id)
+		if seen is None:
+			seen = self._db.execute("SELECT 1 FROM seen WHERE id = ?", (submission_id,)).fetchone() is not None
+		self._remember(submission_id, seen)
+		return seen
+
+	def __len__(self):
+		return self._db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+	def add(self, submission_id):
+		"""Mark a submission as seen"""
+		with self._db:
+			self._db.execute("INSERT OR IGNORE INTO seen (id, seen_at) VALUES (?, ?)", (submission_id, time.time()))
+		self._remember(submission_id, True)
+
+	def close(self):
+		self._db.close()
@@ -93,8 +93,11 @@ def split_embed(embed: nextcord.Embed) -> List[nextcord.Embed]:
     Returns
         - embed_list (List[nextcord.Embed]):
     """
-    if embed.title == nextcord.Embed.Empty:
+    # Newer nextcord versions leave these as None rather than Embed.Empty
+    if embed.title == nextcord.Embed.Empty or embed.title is None:
         embed.title = ""
+    if embed.description is None:
+        embed.description = ""
     EMBED_CHARACTER_LIMIT = 2000
     FIELD_CHARACTER_LIMIT = 1024
     embed_list = []